@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""asyncio building blocks for the event-driven engine (PVC_ENGINE=asyncio).
+
+The serial ports are registered with the event loop as readers instead of
+being polled with sleeps, so a PAM batch that is still waiting for its
+prompt never holds up DWIN input or anything else scheduled on the loop.
+Reply parsing is shared with the blocking PamLink through ReplyCollector.
+"""
+import asyncio
+import time
+
+from pam_link import ReplyCollector, encode_batch
+
+
+# -------------------------------------------------
+# PAM
+# -------------------------------------------------
+
+
+async def query_many(link, cmds, timeout=None):
+    """Non-blocking PamLink.query_many()."""
+    loop = asyncio.get_running_loop()
+    port = link.port
+    port.reset_input_buffer()
+
+    collector = ReplyCollector(
+        link, cmds, link.timeout if timeout is None else timeout)
+    port.write(encode_batch(cmds))
+
+    readable = asyncio.Event()
+    fd = port.fileno()
+    loop.add_reader(fd, readable.set)
+    try:
+        while not collector.done:
+            waiting = port.in_waiting
+            if waiting:
+                collector.feed(port.read(waiting), time.monotonic())
+                continue
+            remaining = collector.deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Level-triggered: set again at once if bytes are still pending
+            readable.clear()
+            try:
+                await asyncio.wait_for(readable.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        loop.remove_reader(fd)
+
+    return collector.finish(time.monotonic())
+
+
+# -------------------------------------------------
+# INPUT STREAMS
+# -------------------------------------------------
+
+
+class PortReader:
+    """Hands everything arriving on a serial port to on_data(bytes)."""
+
+    def __init__(self, port, on_data, on_error=None):
+        self.port = port
+        self.on_data = on_data
+        self.on_error = on_error
+        self.loop = None
+        self.fd = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.fd = self.port.fileno()
+        self.loop.add_reader(self.fd, self._readable)
+
+    def stop(self):
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+
+    def _readable(self):
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except Exception as e:
+            self.stop()
+            if self.on_error:
+                self.on_error(e)
+            return
+        if data:
+            self.on_data(data)
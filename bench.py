@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""Acquisition benchmark for pam_to_dwin.py / pam_to_dwin_v2.py.
+
+Runs the selected script as a child process against the PAM simulator
+(pam_sim.py) and the DWIN emulator (dwin_sim.py) for each scenario and
+prints one JSON document with, per run:
+
+- PAM reads per second for every register
+- main loop period percentiles (time between consecutive IA reads)
+- PAM round-trip histograms per command, as seen by the script
+- DWIN frames and bytes written, and bytes per second
+- CPU time of the script per loop cycle
+- with ``--ble``, notifications per characteristic as seen by a fake
+  central on the BlueZ stand-in (ble_standin.py)
+
+    ./bench.py --duration 10 > before.json
+    ./bench.py --target pam_to_dwin_v2.py --scenario function196
+    ./bench.py --target pam_to_dwin_v2.py --env PVC_ENGINE=asyncio
+
+``--micro`` skips the scenarios and times only the DWIN encode path
+(ns per display cycle through pyserial on a pty, per-VP bytes frames vs.
+the batched writer and its reused FrameBuilder).
+
+``--notify-micro`` emits GATT PropertiesChanged signals on a private
+dbus-daemon instead (needs dbus-python), once with a dbus.Byte list per
+notification as before and once with the single ``ay`` the characteristics
+use now: notifications per second and peak Python heap per notify. It
+also times WriteValue calls from a second connection, handled on a GLib
+thread with and without ``byte_arrays=True``.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tty
+
+from dwin_link import VP_LAYOUTS, DwinWriter
+from dwin_sim import DwinEmulator
+from pam_sim import PamSimulator
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# -------------------------------------------------
+# SCENARIOS
+# -------------------------------------------------
+SCENARIOS = {
+    "function195": {
+        "pam": {"function": 195},
+    },
+    "function196": {
+        "pam": {"function": 196},
+    },
+    "mismatch": {
+        "pam": {"function": 196, "ain_a": "V", "ain_b": "C"},
+        "dwin": {"select_after": (1.0, 1)},
+    },
+    "mismatch_upload": {
+        "pam": {"function": 196, "ain_a": "V", "ain_b": "C"},
+        "dwin": {"select_after": (1.0, 1), "auto_upload": True},
+        "env": {"DWIN_AUTO_UPLOAD": "1"},
+    },
+    "disconnect": {
+        "pam": {"function": 196, "outage": (2.0, 2.0)},
+    },
+}
+
+
+# -------------------------------------------------
+# STATISTICS
+# -------------------------------------------------
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    out = {}
+    for p in points:
+        i = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+        out[f"p{p}"] = round(values[i] * 1000, 3)
+    out["max"] = round(values[-1] * 1000, 3)
+    return out
+
+
+def loop_periods(log, register="IA"):
+    stamps = [t for t, name in log if name == register]
+    return [b - a for a, b in zip(stamps, stamps[1:])]
+
+
+# -------------------------------------------------
+# RUNNER
+# -------------------------------------------------
+
+
+def run_scenario(target, name, duration, latency, jitter, env_extra,
+                 ble_mtu=None):
+    scenario = SCENARIOS[name]
+    tmp = tempfile.mkdtemp(prefix="pvc-bench-")
+    pam_link = os.path.join(tmp, "ttyPAM")
+    dwin_link = os.path.join(tmp, "ttyDWIN")
+    stats_file = os.path.join(tmp, "pam_stats.json")
+
+    pam_cfg = dict(latency=latency, jitter=jitter, seed=1)
+    pam_cfg.update(scenario.get("pam", {}))
+    sim = PamSimulator(link=pam_link, record=True, **pam_cfg)
+    emu = DwinEmulator(link=dwin_link, **scenario.get("dwin", {}))
+    env = dict(os.environ, PAM_PORT=pam_link, DWIN_PORT=dwin_link,
+               PAM_STATS_FILE=stats_file, PYTHONUNBUFFERED="1")
+    env.update(scenario.get("env", {}))
+    env.update(env_extra)
+    log_path = os.path.join(tmp, "output.log")
+    standin = None
+    child = None
+    ble = None
+    sim.start()
+    emu.start()
+    try:
+        if ble_mtu:
+            from ble_standin import BluezStandin
+            standin = BluezStandin(ble_mtu)
+            env["BLE_BUS"] = standin.start()
+        with open(log_path, "wb") as log:
+            started = time.monotonic()
+            child = subprocess.Popen(
+                [sys.executable, os.path.join(HERE, target)],
+                env=env, cwd=HERE, stdout=log, stderr=subprocess.STDOUT)
+            time.sleep(duration)
+            child.send_signal(signal.SIGINT)
+            _, status, usage = os.wait4(child.pid, 0)
+            elapsed = time.monotonic() - started
+        exit_code = os.waitstatus_to_exitcode(status)
+        if standin is not None:
+            ble = standin.summary()
+    finally:
+        # Also on errors and Ctrl-C: no stray script or dbus-daemon
+        if child is not None and child.poll() is None:
+            child.kill()
+            child.wait()
+        sim.stop()
+        emu.stop()
+        if standin is not None:
+            standin.stop()
+
+    reads = {reg: n for reg, n in sim.counts.items() if " " not in reg}
+    writes = {cmd: n for cmd, n in sim.counts.items() if " " in cmd}
+    periods = loop_periods(sim.log)
+    cycles = max(len(periods) + 1, 1)
+
+    pam_stats = {}
+    if os.path.exists(stats_file):
+        with open(stats_file) as f:
+            pam_stats = json.load(f)
+
+    result = {
+        "target": target,
+        "scenario": name,
+        "exit_code": exit_code,
+        "seconds": round(elapsed, 3),
+        "cycles": cycles if periods else 0,
+        "samples_per_s": {reg: round(n / elapsed, 2) if elapsed else 0.0
+                          for reg, n in sorted(reads.items())},
+        "pam_writes": writes,
+        "loop_period_ms": percentiles(periods),
+        "pam_rtt_ms": pam_stats.get("rtt_ms", {}),
+        "pam_status": pam_stats.get("status", {}),
+        "dwin": emu.summary(),
+    }
+    if ble is not None:
+        result["ble"] = ble
+    cpu = usage.ru_utime + usage.ru_stime
+    result["cpu_s"] = round(cpu, 3)
+    result["cpu_ms_per_cycle"] = round(cpu * 1000 / cycles, 3)
+    if exit_code not in (0, 130, -signal.SIGINT):
+        with open(log_path, errors="ignore") as f:
+            result["output_tail"] = f.read()[-2000:]
+    return result
+
+
+# -------------------------------------------------
+# MICRO BENCHMARKS
+# -------------------------------------------------
+
+
+class PtyPort:
+    """A pyserial port on a pty whose far end is drained and discarded."""
+
+    def __init__(self):
+        import serial
+        self.master, slave = os.openpty()
+        tty.setraw(self.master)
+        self.port = serial.Serial(os.ttyname(slave), 115200, timeout=1)
+        os.close(slave)
+        threading.Thread(target=self._drain, daemon=True).start()
+
+    def _drain(self):
+        try:
+            while os.read(self.master, 65536):
+                pass
+        except OSError:
+            pass
+
+    def write(self, data):
+        return self.port.write(data)
+
+    def close(self):
+        self.port.close()
+        os.close(self.master)
+
+
+def legacy_cycle(port, words):
+    # The original send_to_dwin(): one bytes frame and write per VP
+    for vp, word in words:
+        packet = bytes([0x5A, 0xA5, 0x05, 0x82]) + \
+            vp.to_bytes(2, "big") + word.to_bytes(2, "big")
+        port.write(packet)
+
+
+def micro_dwin(iterations):
+    port = PtyPort()
+    results = {}
+    for layout, vps in sorted(VP_LAYOUTS.items()):
+        names = ("WA", "WB", "IA", "IB", "SUPPLY")
+        cases = {
+            "legacy": None,
+            "writer": DwinWriter(crc=False, max_rate=0),
+            "writer_crc": DwinWriter(crc=True, max_rate=0),
+        }
+        for case, writer in cases.items():
+            started = time.perf_counter_ns()
+            for i in range(iterations):
+                # Change every value so nothing is deduplicated away
+                words = [(vps[n], (i + k) & 0xFFFF)
+                         for k, n in enumerate(names)]
+                if writer is None:
+                    legacy_cycle(port, words)
+                else:
+                    for vp, word in words:
+                        writer.set(vp, word)
+                    writer.flush(port)
+            elapsed = time.perf_counter_ns() - started
+            results[f"{layout}/{case}"] = round(elapsed / iterations)
+    port.close()
+    return {"dwin_ns_per_cycle": results, "iterations": iterations}
+
+
+PROP_IFACE = "org.freedesktop.DBus.Properties"
+GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
+NOTIFY_SIZES = (12, 48, 244)    # binary record, text line, full stream MTU
+
+
+def micro_notify(iterations):
+    import tracemalloc
+    import dbus
+    import dbus.mainloop.glib
+    import dbus.service
+    from gi.repository import GLib
+    from ble_standin import private_bus
+
+    class Probe(dbus.service.Object):
+        @dbus.service.signal(PROP_IFACE, signature="sa{sv}as")
+        def PropertiesChanged(self, interface, changed, invalidated):
+            pass
+
+        # Old and new WriteValue: a dbus.Byte per byte vs one bytes object
+        @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
+        def WriteValueLegacy(self, value, options):
+            self.written = bytes(value)
+
+        @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}",
+                             byte_arrays=True)
+        def WriteValue(self, value, options):
+            self.written = bytes(value)
+
+    def timed(notify, data, count, flush):
+        started = time.perf_counter()
+        for _ in range(count):
+            notify(data)
+        flush()
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        peak = 0
+        for _ in range(100):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            notify(data)
+            peak += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        flush()
+        return {"per_s": round(count / elapsed),
+                "peak_alloc_bytes": round(peak / 100)}
+
+    daemon, address = private_bus()
+    loop = None
+    try:
+        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+        bus = dbus.bus.BusConnection(address)
+        probe = Probe(bus, "/bench/char0")
+        changed = dbus.Dictionary({}, signature="sv")
+        no_invalidated = dbus.Array([], signature="s")
+        # Writes arrive on the GLib thread, as in the GATT server
+        loop = GLib.MainLoop()
+        threading.Thread(target=loop.run, daemon=True).start()
+        client = dbus.bus.BusConnection(address)
+        char = dbus.Interface(
+            client.get_object(bus.get_unique_name(), "/bench/char0"),
+            GATT_CHRC_IFACE)
+        options = dbus.Dictionary({}, signature="sv")
+
+        def legacy(data):
+            value = [dbus.Byte(b) for b in data]
+            probe.PropertiesChanged(GATT_CHRC_IFACE, {"Value": value}, [])
+
+        def fast(data):
+            changed["Value"] = dbus.ByteArray(data)
+            probe.PropertiesChanged(GATT_CHRC_IFACE, changed, no_invalidated)
+
+        def write_legacy(data):
+            char.WriteValueLegacy(dbus.ByteArray(data), options)
+
+        def write_bytes(data):
+            char.WriteValue(dbus.ByteArray(data), options)
+
+        notify = {}
+        write = {}
+        # A write waits for its reply: fewer of them
+        writes = max(1, iterations // 10)
+        for size in NOTIFY_SIZES:
+            data = bytes(range(size))
+            for case, fn in (("legacy", legacy), ("bytes", fast)):
+                notify[f"{size}B/{case}"] = timed(fn, data, iterations,
+                                                  bus.flush)
+            for case, fn in (("legacy", write_legacy),
+                             ("bytes", write_bytes)):
+                write[f"{size}B/{case}"] = timed(fn, data, writes,
+                                                 client.flush)
+                assert probe.written == data
+        client.close()
+        bus.close()
+    finally:
+        if loop is not None:
+            loop.quit()
+        daemon.terminate()
+        daemon.wait()
+    return {"dbus_notify": notify, "dbus_write": write,
+            "iterations": iterations, "write_iterations": writes}
+
+
+# -------------------------------------------------
+# CLI
+# -------------------------------------------------
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--target", default="pam_to_dwin.py",
+                   choices=("pam_to_dwin.py", "pam_to_dwin_v2.py"))
+    p.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                   help="run only this scenario (repeatable)")
+    p.add_argument("--duration", type=float, default=8.0,
+                   help="seconds per scenario")
+    p.add_argument("--latency", type=float, default=0.005,
+                   help="simulated PAM reply latency in seconds")
+    p.add_argument("--jitter", type=float, default=0.001)
+    p.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                   help="extra environment for the script under test")
+    p.add_argument("--output", help="write JSON here instead of stdout")
+    p.add_argument("--micro", type=int, nargs="?", const=20000,
+                   metavar="ITERATIONS",
+                   help="time the DWIN encode path only")
+    p.add_argument("--ble", type=int, nargs="?", const=247, metavar="MTU",
+                   help="serve BLE to a fake central on a BlueZ stand-in "
+                        "(ble_standin.py)")
+    p.add_argument("--notify-micro", type=int, nargs="?", const=20000,
+                   metavar="ITERATIONS",
+                   help="time BLE notifications on a private D-Bus only")
+    args = p.parse_args()
+
+    env_extra = dict(kv.split("=", 1) for kv in args.env)
+    results = []
+    if args.micro:
+        results.append(micro_dwin(args.micro))
+    if args.notify_micro:
+        results.append(micro_notify(args.notify_micro))
+    micro = args.micro or args.notify_micro
+    for name in [] if micro else args.scenario or sorted(SCENARIOS):
+        print(f"⏱ {args.target} / {name} ...", file=sys.stderr)
+        result = run_scenario(args.target, name, args.duration,
+                              args.latency, args.jitter, env_extra, args.ble)
+        print(f"   IA {result['samples_per_s'].get('IA', 0)}/s, "
+              f"loop p50 {result['loop_period_ms'].get('p50')} ms, "
+              f"DWIN {result['dwin']['bytes_per_s']} B/s",
+              file=sys.stderr)
+        results.append(result)
+
+    doc = json.dumps({"runs": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(doc + "\n")
+    else:
+        print(doc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Settings the app writes over BLE, and the acks it gets back.
+
+One text command per write, as the config and inputs screens send them:
+
+    195, 196                FUNCTION 195 / 196
+    AINA:<mode>, AINB:<mode>
+                            one input to VOLTAGE / CURRENT (or V / C)
+    VOLTAGE, CURRENT        AINA to V / C, under function 195 only
+    CUR:<mA>:195            coil current under function 195
+    CURA:<mA>:196           coil A current under function 196
+    CURB:<mA>:196           coil B current under function 196
+
+Under function 196 a bare VOLTAGE/CURRENT does not say which input it
+is for, so it is refused rather than guessed; the app sends AINA:/AINB:.
+
+Currents must be within 500..2600 mA and the function suffix must match
+the function the PAM runs now. They are still refused after that check:
+the PAM console commands for the coil current setpoints are not
+confirmed yet, see CURRENT_COMMANDS.
+
+Each command is answered on the command characteristic with one line in
+the telemetry's ``KEY:value`` style:
+
+    ACK:196,STATUS:ok,RTT:5.8,WAIT:3.1,REPLY:196
+
+RTT is the PAM round trip and WAIT the time the command was queued, both
+in ms. STATUS is a PamResponse status (ok, partial, timeout), ``err``
+if the PAM answered ERR, ``error`` if the port failed, or ``rejected``
+(with REASON, and no RTT) if the command never reached the PAM.
+"""
+import time
+
+CURRENT_MIN = 500
+CURRENT_MAX = 2600
+
+# App name -> (PAM console command, function it applies to). The console
+# command is None until it is confirmed against the PAM documentation;
+# such commands are validated but never sent.
+CURRENT_COMMANDS = {
+    "CUR": (None, 195),
+    "CURA": (None, 196),
+    "CURB": (None, 196),
+}
+FUNCTIONS = (195, 196)
+AIN_MODES = {"VOLTAGE": "V", "CURRENT": "C"}
+AIN_VALUES = {"VOLTAGE": "V", "CURRENT": "C", "V": "V", "C": "C"}
+AIN_CHANNELS = ("AINA", "AINB")
+
+
+class CommandJob:
+    """One app command and the PAM commands it expands to."""
+
+    __slots__ = ("text", "cmds", "queued", "reply")
+
+    def __init__(self, text, cmds, reply=None, queued=None):
+        self.text = text
+        self.cmds = list(cmds)
+        self.reply = reply
+        self.queued = time.monotonic() if queued is None else queued
+
+
+def parse(data, function):
+    """PAM commands for one write; ValueError says why it was refused."""
+    try:
+        text = bytes(data).decode("ascii").strip().upper()
+    except UnicodeDecodeError:
+        raise ValueError("not ASCII")
+    if not text:
+        raise ValueError("empty")
+
+    if text.isdigit():
+        if int(text) not in FUNCTIONS:
+            raise ValueError(f"unknown function {text}")
+        return text, [f"FUNCTION {int(text)}"]
+
+    if text in AIN_MODES:
+        if function != 195:
+            raise ValueError("which input? send AINA:/AINB:")
+        return text, [f"AINA {AIN_MODES[text]}"]
+
+    parts = text.split(":")
+    if len(parts) == 2 and parts[0] in AIN_CHANNELS:
+        if parts[1] not in AIN_VALUES:
+            raise ValueError(f"unknown input mode {parts[1]}")
+        return text, [f"{parts[0]} {AIN_VALUES[parts[1]]}"]
+    if len(parts) != 3 or parts[0] not in CURRENT_COMMANDS:
+        raise ValueError("unknown command")
+    pam_cmd, needs = CURRENT_COMMANDS[parts[0]]
+    try:
+        value = int(parts[1])
+        func = int(parts[2])
+    except ValueError:
+        raise ValueError("bad number")
+    if func != needs:
+        raise ValueError(f"{parts[0]} is for function {needs}")
+    if function is not None and func != function:
+        raise ValueError(f"PAM runs function {function}")
+    if not CURRENT_MIN <= value <= CURRENT_MAX:
+        raise ValueError(f"out of range ({CURRENT_MIN}-{CURRENT_MAX} mA)")
+    if pam_cmd is None:
+        raise ValueError(f"no confirmed PAM command for {parts[0]} yet")
+    return text, [f"{pam_cmd} {value}"]
+
+
+def _clean(text):
+    # Separators of the ack line must not appear inside a value
+    return " ".join(text.replace(",", " ").replace(":", " ").split())
+
+
+def reply_value(resp):
+    """The PAM's answer without echo and prompt."""
+    lines = []
+    for line in resp.text.replace(">", "").splitlines():
+        line = line.strip()
+        if line and line != resp.cmd:
+            lines.append(line)
+    return " ".join(lines)
+
+
+def encode_ack(job, replies, started):
+    """Ack for a finished job; replies is None if the port failed."""
+    head = f"ACK:{_clean(job.text)}"
+    wait = (started - job.queued) * 1000
+    if replies is None:
+        return f"{head},STATUS:error,WAIT:{wait:.1f}\n".encode()
+    values = [reply_value(r) for r in replies]
+    status = next((r.status for r in replies if not r.ok), "ok")
+    if status == "ok" and any(v.startswith("ERR") for v in values):
+        status = "err"
+    rtt = max(r.rtt for r in replies) * 1000
+    reply = _clean(" ".join(values))
+    return (f"{head},STATUS:{status},RTT:{rtt:.1f},WAIT:{wait:.1f},"
+            f"REPLY:{reply}\n").encode()
+
+
+def encode_reject(data, reason):
+    text = _clean(bytes(data).decode("ascii", errors="replace"))
+    return f"ACK:{text},STATUS:rejected,REASON:{_clean(reason)}\n".encode()
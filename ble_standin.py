@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""BlueZ stand-in for running the GATT server without a radio.
+
+Starts a private dbus-daemon and owns ``org.bluez`` on it with one fake
+adapter (/org/bluez/hci0) offering GattManager1 and LEAdvertisingManager1,
+which is all find_adapter() and main() of pam_to_dwin_v2.py and
+pi_to_mobile.py look for. Point them at it with ``BLE_BUS=<address>``.
+
+When an application registers, a fake central subscribes to every
+notifying characteristic without reading it first, as a phone does:
+through AcquireNotify (passing ``mtu`` like BlueZ does) where the
+characteristic offers it, StartNotify otherwise. It records every
+notification it gets, from the socket or as PropertiesChanged:
+notifications per second, payload sizes and the jitter of the intervals.
+With ``--seq`` payloads are taken to start like pi_to_mobile.py's (u32
+sequence number, u32 send time in us), and lost notifications and the
+one-way latency are reported too.
+
+    ./ble_standin.py --duration 10 --seq -- ./pi_to_mobile.py --rate 500
+    ./bench.py --target pam_to_dwin_v2.py --scenario function196 --ble
+
+Prints one JSON document per run (see FakeCentral.summary()).
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import dbus
+import dbus.mainloop.glib
+import dbus.service
+from gi.repository import GLib
+
+from bench import percentiles
+
+BLUEZ_SERVICE_NAME = "org.bluez"
+DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
+GATT_MANAGER_IFACE = "org.bluez.GattManager1"
+LE_ADVERTISING_MANAGER_IFACE = "org.bluez.LEAdvertisingManager1"
+GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
+LE_ADVERTISEMENT_IFACE = "org.bluez.LEAdvertisement1"
+PROP_IFACE = "org.freedesktop.DBus.Properties"
+
+ADAPTER_PATH = "/org/bluez/hci0"
+DEFAULT_MTU = 247
+
+# pi_to_mobile.LOAD_HEADER: sequence number, send time (monotonic us)
+_SEQ = struct.Struct("<II")
+
+
+def private_bus():
+    """Start a dbus-daemon of our own; returns (process, address)."""
+    daemon = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+        stdout=subprocess.PIPE, text=True)
+    return daemon, daemon.stdout.readline().strip()
+
+
+# -------------------------------------------------
+# MOCK BLUEZ
+# -------------------------------------------------
+
+
+class BluezRoot(dbus.service.Object):
+    def __init__(self, bus):
+        dbus.service.Object.__init__(self, bus, "/")
+
+    @dbus.service.method(DBUS_OM_IFACE, out_signature="a{oa{sa{sv}}}")
+    def GetManagedObjects(self):
+        return {
+            dbus.ObjectPath(ADAPTER_PATH): {
+                GATT_MANAGER_IFACE: {},
+                LE_ADVERTISING_MANAGER_IFACE: {},
+            }
+        }
+
+
+class Adapter(dbus.service.Object):
+    """Accepts one GATT application and hands it to on_application."""
+
+    def __init__(self, bus, on_application):
+        dbus.service.Object.__init__(self, bus, ADAPTER_PATH)
+        self.bus = bus
+        self.on_application = on_application
+        self.advertisements = {}
+
+    @dbus.service.method(GATT_MANAGER_IFACE, in_signature="oa{sv}",
+                         sender_keyword="sender")
+    def RegisterApplication(self, path, options, sender=None):
+        print(f"🔵 BlueZ stand-in: application {path} from {sender}")
+        # Reply first: the app is waiting for it on its own main loop
+        GLib.idle_add(self.on_application, sender, path)
+
+    @dbus.service.method(GATT_MANAGER_IFACE, in_signature="o")
+    def UnregisterApplication(self, path):
+        pass
+
+    @dbus.service.method(LE_ADVERTISING_MANAGER_IFACE, in_signature="oa{sv}",
+                         sender_keyword="sender")
+    def RegisterAdvertisement(self, path, options, sender=None):
+        GLib.idle_add(self._read_advertisement, sender, path)
+
+    @dbus.service.method(LE_ADVERTISING_MANAGER_IFACE, in_signature="o")
+    def UnregisterAdvertisement(self, path):
+        self.advertisements.pop(str(path), None)
+
+    def _read_advertisement(self, sender, path):
+        props = dbus.Interface(self.bus.get_object(sender, path), PROP_IFACE)
+        props.GetAll(LE_ADVERTISEMENT_IFACE,
+                     reply_handler=lambda p: self.advertisements.update(
+                         {str(path): dict(p)}),
+                     error_handler=lambda e: print("⚠ Advertisement:", e))
+        return False
+
+
+# -------------------------------------------------
+# FAKE CENTRAL
+# -------------------------------------------------
+
+
+class FakeCentral:
+    """Subscribes to everything an application offers and times it."""
+
+    def __init__(self, bus, mtu=DEFAULT_MTU, sequenced=False):
+        self.bus = bus
+        self.mtu = mtu
+        self.sequenced = sequenced
+        self.uuids = {}
+        self.stamps = {}
+        self.sizes = {}
+        self.last_seq = {}
+        self.lost = {}
+        self.latency = {}
+        self.acquired = {}
+        self.errors = 0
+        self.started = None
+
+    def attach(self, sender, path):
+        om = dbus.Interface(self.bus.get_object(sender, path), DBUS_OM_IFACE)
+        om.GetManagedObjects(
+            reply_handler=lambda objects: self._subscribe(sender, objects),
+            error_handler=self._error)
+        return False
+
+    def _error(self, e):
+        self.errors += 1
+        print("⚠ Fake central:", e)
+
+    def _subscribe(self, sender, objects):
+        self.bus.add_signal_receiver(
+            self._on_changed, "PropertiesChanged", PROP_IFACE, sender,
+            path_keyword="path")
+        options = {"mtu": dbus.UInt16(self.mtu)}
+        for path, ifaces in objects.items():
+            chrc = ifaces.get(GATT_CHRC_IFACE)
+            if not chrc:
+                continue
+            path = str(path)
+            flags = [str(f) for f in chrc["Flags"]]
+            self.uuids[path] = str(chrc["UUID"])
+            self.stamps[path] = []
+            self.sizes[path] = []
+            self.lost[path] = 0
+            self.latency[path] = []
+            self.acquired[path] = False
+            if "notify" not in flags:
+                continue
+            char = dbus.Interface(self.bus.get_object(sender, path),
+                                  GATT_CHRC_IFACE)
+            if "NotifyAcquired" in chrc:
+                char.AcquireNotify(
+                    options,
+                    reply_handler=lambda fd, mtu, path=path:
+                        self._on_acquired(path, fd, mtu),
+                    error_handler=self._error)
+            else:
+                char.StartNotify(reply_handler=lambda: None,
+                                 error_handler=self._error)
+        self.started = time.monotonic()
+        print(f"🔵 Fake central: subscribed to {len(self.uuids)} "
+              f"characteristics, MTU {self.mtu}")
+
+    def _on_acquired(self, path, fd, mtu):
+        sock = socket.socket(fileno=fd.take())
+        self.acquired[path] = sock
+        if int(mtu) != self.mtu:
+            print(f"⚠ Fake central: {path} answered MTU {int(mtu)}")
+        GLib.io_add_watch(sock.fileno(), GLib.PRIORITY_DEFAULT,
+                          GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                          self._on_socket, path)
+
+    def _on_socket(self, fd, condition, path):
+        sock = self.acquired[path]
+        data = b""
+        if condition & GLib.IO_IN:
+            data = sock.recv(65536)
+        if not data:
+            # Server released it
+            sock.close()
+            return False
+        self._record(path, data)
+        return True
+
+    def _on_changed(self, interface, changed, invalidated, path=None):
+        if interface != GATT_CHRC_IFACE or "Value" not in changed:
+            return
+        self._record(path, changed["Value"])
+
+    def _record(self, path, value):
+        stamps = self.stamps.get(path)
+        if stamps is None:
+            return
+        now = time.monotonic()
+        stamps.append(now)
+        self.sizes[path].append(len(value))
+        if self.sequenced and len(value) >= _SEQ.size:
+            self._check_seq(path, bytes(value[:_SEQ.size]), now)
+
+    def _check_seq(self, path, head, now):
+        seq, sent_us = _SEQ.unpack(head)
+        last = self.last_seq.get(path)
+        if last is not None:
+            # Anything between the last one and this one never arrived
+            self.lost[path] += (seq - last - 1) & 0xFFFFFFFF
+        self.last_seq[path] = seq
+        late_us = (int(now * 1e6) - sent_us) & 0xFFFFFFFF
+        self.latency[path].append(late_us / 1e6)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        chars = {}
+        for path, uuid in sorted(self.uuids.items()):
+            stamps = self.stamps[path]
+            sizes = self.sizes[path]
+            intervals = [b - a for a, b in zip(stamps, stamps[1:])]
+            entry = {
+                "notifications": len(stamps),
+                "per_s": 0.0,
+                "bytes_per_s": 0.0,
+                "size": {},
+                "interval_ms": percentiles(intervals),
+                "jitter_ms": None,
+                "acquired": bool(self.acquired[path]),
+            }
+            if elapsed:
+                entry["per_s"] = round(len(stamps) / elapsed, 2)
+                entry["bytes_per_s"] = round(sum(sizes) / elapsed, 1)
+            if sizes:
+                entry["size"] = {"min": min(sizes), "max": max(sizes),
+                                 "mean": round(statistics.mean(sizes), 1)}
+            if len(intervals) > 1:
+                # Spread of the intervals around their mean
+                entry["jitter_ms"] = round(
+                    statistics.pstdev(intervals) * 1000, 3)
+            if self.sequenced:
+                entry["lost"] = self.lost[path]
+                entry["latency_ms"] = percentiles(self.latency[path])
+            chars[uuid] = entry
+        return {
+            "seconds": round(elapsed, 3),
+            "mtu": self.mtu,
+            "errors": self.errors,
+            "characteristics": chars,
+        }
+
+
+# -------------------------------------------------
+# STAND-IN
+# -------------------------------------------------
+
+
+class BluezStandin:
+    """Private bus, mock adapter and fake central on a GLib thread."""
+
+    def __init__(self, mtu=DEFAULT_MTU, sequenced=False):
+        self.mtu = mtu
+        self.sequenced = sequenced
+        self.daemon = None
+        self.address = None
+        self.bus = None
+        self.bus_name = None
+        self.central = None
+        self.root = None
+        self.adapter = None
+        self.loop = None
+        self._thread = None
+
+    def start(self):
+        self.daemon, self.address = private_bus()
+        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+        bus = self.bus = dbus.bus.BusConnection(self.address)
+        self.bus_name = dbus.service.BusName(BLUEZ_SERVICE_NAME, bus)
+        self.central = FakeCentral(bus, self.mtu, self.sequenced)
+        self.root = BluezRoot(bus)
+        self.adapter = Adapter(bus, self.central.attach)
+        self.loop = GLib.MainLoop()
+        self._thread = threading.Thread(target=self.loop.run, daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.quit()
+            self._thread.join(timeout=1.0)
+        if self.bus is not None:
+            # Give the name back while the daemon can still answer
+            self.bus_name = None
+            self.bus.close()
+            self.bus = None
+        if self.daemon is not None:
+            self.daemon.terminate()
+            self.daemon.wait()
+
+    def summary(self):
+        result = self.central.summary()
+        result["advertisements"] = {
+            path: str(props.get("LocalName"))
+            for path, props in self.adapter.advertisements.items()}
+        return result
+
+
+# -------------------------------------------------
+# CLI
+# -------------------------------------------------
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--duration", type=float, default=10.0,
+                   help="seconds to listen after starting the command")
+    p.add_argument("--mtu", type=int, default=DEFAULT_MTU,
+                   help="ATT MTU the fake central reports")
+    p.add_argument("--seq", action="store_true",
+                   help="count lost notifications and latency "
+                        "(pi_to_mobile.py payloads)")
+    p.add_argument("command", nargs="*",
+                   help="GATT server to run with BLE_BUS set")
+    args = p.parse_args()
+
+    standin = BluezStandin(args.mtu, args.seq)
+    address = standin.start()
+    print(f"BLE_BUS={address}", file=sys.stderr)
+    child = None
+    try:
+        if args.command:
+            child = subprocess.Popen(args.command,
+                                     env=dict(os.environ, BLE_BUS=address))
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if child is not None:
+            # SIGINT, so the server can print its own summary
+            child.send_signal(signal.SIGINT)
+            child.wait()
+        result = standin.summary()
+        standin.stop()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Telemetry payloads for the BLE data characteristics.
+
+The text format (``FUNC:196,WA:...,MODE:V\\n``) stays on the original
+characteristic for existing apps. The binary characteristic carries the
+same machine state as a fixed 12-byte little-endian record:
+
+    offset  type  field
+    0       u8    version (1)
+    1       u8    flags: bit0 MODE is C, bit1 MODE known, bit2 PIN15,
+                  bit3 PIN6, bit4 ENABLE_B
+    2       u16   FUNC (0 = unknown)
+    4       i16   WA x 1000 (V or mA)
+    6       i16   WB x 1000
+    8       i16   IA (raw PAM value)
+    10      i16   IB (raw PAM value)
+
+Values that are not known yet are sent as -32768.
+
+The stream characteristic batches IA/IB samples at the acquisition rate,
+as many per notification as the negotiated ATT MTU allows:
+
+    0       u8    version (1)
+    1       u8    sample count N
+    2       u32   time of the first sample, ms (wraps)
+    6 + 6k  u16   ms since the previous sample (0 for the first)
+    8 + 6k  i16   IA (raw)
+    10 + 6k i16   IB (raw)
+
+In delta mode the binary characteristic sends version 2 packets: u8
+version, u8 sequence number, u8 field mask, then only the masked fields
+in record order (flags u8, FUNC u16, WA, WB, IA, IB i16). Mask bit 0x80
+marks a keyframe, which carries every field. The app writes ``K`` to ask
+for a keyframe (e.g. after a sequence gap), ``D`` to switch to delta
+mode and ``F`` to go back to full records.
+"""
+import struct
+from collections import deque
+
+VERSION = 1
+MISSING = -0x8000
+
+FLAG_MODE_C = 0x01
+FLAG_MODE_KNOWN = 0x02
+FLAG_PIN15 = 0x04
+FLAG_PIN6 = 0x08
+FLAG_ENABLE_B = 0x10
+
+_RECORD = struct.Struct("<BBHhhhh")
+RECORD_SIZE = _RECORD.size
+
+_BATCH_HEAD = struct.Struct("<BBI")
+_SAMPLE = struct.Struct("<Hhh")
+ATT_HEADER = 3          # opcode + handle in front of every notification
+DEFAULT_MTU = 23
+
+
+def fixed_point(value, scale=1):
+    if value is None:
+        return MISSING
+    return max(-0x7FFF, min(0x7FFF, int(round(value * scale))))
+
+
+def flags_of(state):
+    flags = 0
+    mode = state.get("MODE")
+    if mode is not None:
+        flags |= FLAG_MODE_KNOWN
+        if mode == "C":
+            flags |= FLAG_MODE_C
+    if state.get("PIN15"):
+        flags |= FLAG_PIN15
+    if state.get("PIN6"):
+        flags |= FLAG_PIN6
+    if state.get("ENABLE_B"):
+        flags |= FLAG_ENABLE_B
+    return flags
+
+
+# Split characteristics: fast values vs. rarely changing status
+FAST_FIELDS = ("WA", "WB", "IA", "IB")
+STATUS_FIELDS = ("FUNC", "MODE", "MODE_B", "PAM_MODE")
+
+
+def _text(value, digits=None):
+    if value is None or digits is None:
+        return str(value)
+    return f"{value:.{digits}f}"
+
+
+def encode_fast(state):
+    # Fixed decimals instead of float repr: WA/WB to 1 mV / 1 uA
+    return (
+        f"WA:{_text(state['WA'], 3)},"
+        f"WB:{_text(state['WB'], 3)},"
+        f"IA:{_text(state['IA'], 0)},"
+        f"IB:{_text(state['IB'], 0)}\n"
+    ).encode("utf-8")
+
+
+def encode_status(state):
+    return (
+        f"FUNC:{state['FUNC']},"
+        f"MODE:{state['MODE']},"
+        f"MODE_B:{state['MODE_B']},"
+        f"PAM_MODE:{state['PAM_MODE']}\n"
+    ).encode("utf-8")
+
+
+def encode_text(state):
+    return (
+        f"FUNC:{state['FUNC']},"
+        f"WA:{state['WA']},"
+        f"WB:{state['WB']},"
+        f"IA:{state['IA']},"
+        f"IB:{state['IB']},"
+        f"MODE:{state['MODE']}\n"
+    ).encode("utf-8")
+
+
+def record_fields(state):
+    """(flags, FUNC, WA, WB, IA, IB) as they go on the wire."""
+    return (flags_of(state), state.get("FUNC") or 0,
+            fixed_point(state.get("WA"), 1000),
+            fixed_point(state.get("WB"), 1000),
+            fixed_point(state.get("IA")), fixed_point(state.get("IB")))
+
+
+def encode_binary(state):
+    return _RECORD.pack(VERSION, *record_fields(state))
+
+
+def decode_binary(data):
+    """Inverse of encode_binary(), for tools and tests."""
+    version, flags, func, wa, wb, ia, ib = _RECORD.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"unknown telemetry version {version}")
+
+    def value(raw, scale=1):
+        return None if raw == MISSING else raw / scale
+
+    mode = None
+    if flags & FLAG_MODE_KNOWN:
+        mode = "C" if flags & FLAG_MODE_C else "V"
+    return {
+        "FUNC": func or None,
+        "WA": value(wa, 1000),
+        "WB": value(wb, 1000),
+        "IA": value(ia),
+        "IB": value(ib),
+        "MODE": mode,
+        "PIN15": bool(flags & FLAG_PIN15),
+        "PIN6": bool(flags & FLAG_PIN6),
+        "ENABLE_B": bool(flags & FLAG_ENABLE_B),
+    }
+
+
+# -------------------------------------------------
+# DELTA MODE
+# -------------------------------------------------
+DELTA_VERSION = 2
+KEYFRAME = 0x80
+# Wire format per field of record_fields()
+_DELTA_FIELDS = (struct.Struct("<B"), struct.Struct("<H")) + \
+    (struct.Struct("<h"),) * 4
+ALL_FIELDS = (1 << len(_DELTA_FIELDS)) - 1
+
+
+class DeltaEncoder:
+    """Sends only the fields that changed, plus a keyframe every
+    keyframe_interval seconds or on request."""
+
+    def __init__(self, keyframe_interval=5.0):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.last = None
+        self.next_keyframe = 0.0
+
+    def request_keyframe(self):
+        self.next_keyframe = 0.0
+
+    def keyframe_due(self, now):
+        return now >= self.next_keyframe
+
+    def encode(self, state, now):
+        """Next packet, or None if nothing changed and no keyframe is due."""
+        fields = record_fields(state)
+        if self.keyframe_due(now) or self.last is None:
+            mask = ALL_FIELDS | KEYFRAME
+            self.next_keyframe = now + self.keyframe_interval
+        else:
+            mask = 0
+            for i, (old, new) in enumerate(zip(self.last, fields)):
+                if old != new:
+                    mask |= 1 << i
+            if not mask:
+                return None
+
+        out = bytearray((DELTA_VERSION, self.seq, mask))
+        for i, st in enumerate(_DELTA_FIELDS):
+            if mask & (1 << i):
+                out += st.pack(fields[i])
+        self.last = fields
+        self.seq = (self.seq + 1) & 0xFF
+        return bytes(out)
+
+
+class DeltaDecoder:
+    """App-side reference: rebuilds record_fields() from delta packets."""
+
+    def __init__(self):
+        self.fields = None
+        self.seq = None
+        self.gaps = 0
+
+    def feed(self, data):
+        """Returns the current fields, or None until a keyframe arrived."""
+        version, seq, mask = data[0], data[1], data[2]
+        if version != DELTA_VERSION:
+            raise ValueError(f"unknown telemetry version {version}")
+        if self.seq is not None and seq != (self.seq + 1) & 0xFF:
+            self.gaps += 1
+            if not mask & KEYFRAME:
+                # Lost something: wait for a keyframe (and ask for one)
+                self.fields = None
+        self.seq = seq
+        if mask & KEYFRAME:
+            fields = [0] * len(_DELTA_FIELDS)
+        elif self.fields is None:
+            return None
+        else:
+            fields = list(self.fields)
+        offset = 3
+        for i, st in enumerate(_DELTA_FIELDS):
+            if mask & (1 << i):
+                fields[i] = st.unpack_from(data, offset)[0]
+                offset += st.size
+        self.fields = tuple(fields)
+        return self.fields
+
+
+class SampleBatcher:
+    """Collects (t, IA, IB) samples and packs them per notification.
+
+    add() may be called from the acquisition thread; take() from the one
+    that sends. A batch leaves when it fills a notification or when its
+    oldest sample is max_latency old.
+    """
+
+    def __init__(self, max_latency=0.1, maxlen=512):
+        self.max_latency = max_latency
+        self.samples = deque(maxlen=maxlen)
+
+    def add(self, t, ia, ib):
+        self.samples.append((t, ia, ib))
+
+    def clear(self):
+        self.samples.clear()
+
+    @staticmethod
+    def capacity(mtu):
+        room = max(DEFAULT_MTU, mtu) - ATT_HEADER - _BATCH_HEAD.size
+        return max(1, min(255, room // _SAMPLE.size))
+
+    def wait_time(self, now):
+        if not self.samples:
+            return None
+        return max(0.0, self.samples[0][0] + self.max_latency - now)
+
+    def take(self, now, mtu=DEFAULT_MTU):
+        samples = self.samples
+        count = self.capacity(mtu)
+        if not samples or (len(samples) < count and
+                           now - samples[0][0] < self.max_latency):
+            return None
+
+        count = min(count, len(samples))
+        buf = bytearray(_BATCH_HEAD.size + count * _SAMPLE.size)
+        # Deltas between whole-ms timestamps, so rounding never adds up
+        prev = int(samples[0][0] * 1000)
+        _BATCH_HEAD.pack_into(buf, 0, VERSION, count, prev & 0xFFFFFFFF)
+        offset = _BATCH_HEAD.size
+        for _ in range(count):
+            t, ia, ib = samples.popleft()
+            ms = int(t * 1000)
+            _SAMPLE.pack_into(buf, offset, min(0xFFFF, ms - prev),
+                              fixed_point(ia), fixed_point(ib))
+            prev = ms
+            offset += _SAMPLE.size
+        return bytes(buf)
+
+
+def decode_batch(data):
+    """Inverse of SampleBatcher.take(): [(t_ms, IA, IB), ...]."""
+    version, count, t = _BATCH_HEAD.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"unknown telemetry version {version}")
+    out = []
+    for k in range(count):
+        dt, ia, ib = _SAMPLE.unpack_from(
+            data, _BATCH_HEAD.size + k * _SAMPLE.size)
+        t += dt
+        out.append((t, None if ia == MISSING else ia,
+                    None if ib == MISSING else ib))
+    return out
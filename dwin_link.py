@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Batched VP writes to the DWIN display.
+
+Values set during a cycle are collected and written with one ``write()``
+per flush. VPs that are numerically adjacent share a single multi-word
+0x82 frame, so with the compact VP layout the whole WA/WB/IA/IB/supply
+block goes out as one 16-byte frame instead of five 8-byte ones. Frames
+are packed into a buffer that is reused from cycle to cycle.
+
+Unchanged values are not re-sent every cycle, but they are not trusted
+forever either: the writer mirrors what the display should show and
+re-sends entries older than DWIN_MAX_STALE seconds, a few per flush, so
+a display that rebooted or lost a frame catches up without a burst.
+resync() re-sends everything at once (port reopened, page switched).
+
+Flushes are limited to DWIN_MAX_RATE per second; values set in between
+simply replace each other. Per-VP deadbands (in raw words) keep sensor
+noise from being written at all.
+"""
+import os
+import time
+
+from dwin_protocol import MAX_WORDS, FrameBuilder
+from rate_limit import within_deadband
+
+# -------------------------------------------------
+# CONFIGURATION
+# -------------------------------------------------
+VP_LAYOUTS = {
+    # One VP per value, as in the original HMI project
+    "classic": {
+        "MODE": 0x5000,
+        "WA": 0x5500,
+        "WB": 0x5600,
+        "IA": 0x5700,
+        "IB": 0x5800,
+        "SUPPLY": 0x5900,
+    },
+    # Adjacent words: needs the HMI project variables moved accordingly
+    "compact": {
+        "MODE": 0x5000,
+        "WA": 0x5500,
+        "WB": 0x5501,
+        "IA": 0x5502,
+        "IB": 0x5503,
+        "SUPPLY": 0x5504,
+    },
+}
+
+DWIN_VP_LAYOUT = os.environ.get("DWIN_VP_LAYOUT", "classic")
+VP = VP_LAYOUTS[DWIN_VP_LAYOUT]
+
+# Set to 1 when the display project has CRC enabled
+DWIN_CRC = os.environ.get("DWIN_CRC", "0") == "1"
+
+# Mode-mismatch page and the operator's V/C selection on it
+PAGE_MISMATCH = 28
+VP_SELECT = 0x5100
+
+# Set to 1 when the display pushes touch input itself (auto-upload);
+# otherwise VP_SELECT is requested every DWIN_READ_INTERVAL seconds
+DWIN_AUTO_UPLOAD = os.environ.get("DWIN_AUTO_UPLOAD", "0") == "1"
+DWIN_READ_INTERVAL = 0.15
+
+# Unchanged values are refreshed after this many seconds, at most
+# DWIN_TRICKLE of them per flush
+DWIN_MAX_STALE = float(os.environ.get("DWIN_MAX_STALE", "2.0"))
+DWIN_TRICKLE = 2
+
+# Display updates per second (0 = every cycle) and per-value deadbands in
+# raw words (IA/IB are 0.1 mA per word)
+DWIN_MAX_RATE = float(os.environ.get("DWIN_MAX_RATE", "20"))
+DWIN_DEADBANDS = {"IA": 1, "IB": 1}
+
+
+def signed(word):
+    return word - 0x10000 if word & 0x8000 else word
+
+
+def runs(vps, max_words=MAX_WORDS):
+    """Group sorted VPs into runs of consecutive addresses."""
+    run = []
+    for vp in vps:
+        if run and (vp != run[-1] + 1 or len(run) == max_words):
+            yield run
+            run = []
+        run.append(vp)
+    if run:
+        yield run
+
+
+# -------------------------------------------------
+# WRITER
+# -------------------------------------------------
+
+
+class DwinWriter:
+    def __init__(self, max_words=MAX_WORDS, crc=DWIN_CRC,
+                 max_stale=DWIN_MAX_STALE, trickle=DWIN_TRICKLE,
+                 max_rate=DWIN_MAX_RATE, deadbands=None):
+        self.max_words = max_words
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        if deadbands is None:
+            deadbands = {VP[name]: band
+                         for name, band in DWIN_DEADBANDS.items()}
+        self.deadbands = deadbands
+        self.next_flush = 0.0
+        self.max_stale = max_stale
+        self.trickle = trickle
+        self.builder = FrameBuilder(crc=crc)
+        # sorted VP tuple -> runs; the set of changed VPs repeats a lot
+        self.plans = {}
+        self.pending = {}
+        # Mirror of the display: VP -> word, and when it was last written
+        self.sent = {}
+        self.sent_at = {}
+        self.refreshed = 0
+        self._check_at = 0.0
+
+    def set(self, vp, word):
+        word &= 0xFFFF
+        if vp not in self.pending:
+            old = self.sent.get(vp)
+            if old == word:
+                return
+            band = self.deadbands.get(vp)
+            if band and old is not None and \
+                    within_deadband(signed(old), signed(word), band):
+                return
+        self.pending[vp] = word
+
+    def resync(self):
+        """Re-send every known value with the next flush."""
+        for vp, word in self.sent.items():
+            self.pending.setdefault(vp, word)
+
+    def _refresh_stale(self, now):
+        if now < self._check_at:
+            return
+        oldest = now - self.max_stale
+        stale = []
+        first = now
+        for vp, t in self.sent_at.items():
+            if t <= oldest and vp not in self.pending:
+                stale.append((t, vp))
+            elif t < first:
+                first = t
+        stale.sort()
+        for _, vp in stale[:self.trickle]:
+            self.pending[vp] = self.sent[vp]
+            self.refreshed += 1
+        # Nothing else can go stale before this
+        if len(stale) > self.trickle:
+            self._check_at = now
+        else:
+            self._check_at = first + self.max_stale
+
+    def flush(self, port, now=None):
+        if now is None:
+            now = time.monotonic()
+        if now < self.next_flush:
+            return 0
+        if self.max_stale:
+            self._refresh_stale(now)
+        pending = self.pending
+        if not pending:
+            return 0
+
+        vps = tuple(sorted(pending))
+        plan = self.plans.get(vps)
+        if plan is None:
+            plan = self.plans[vps] = [tuple(run) for run in
+                                      runs(vps, self.max_words)]
+
+        builder = self.builder
+        builder.reset()
+        for run in plan:
+            builder.put_write(run[0], [pending[vp] for vp in run])
+
+        data = builder.frames()
+        # Raises on a dead port; pending values are then kept for next time
+        port.write(data)
+        self.next_flush = now + self.min_interval
+        self.sent.update(pending)
+        sent_at = self.sent_at
+        for vp in pending:
+            sent_at[vp] = now
+        pending.clear()
+        return len(data)
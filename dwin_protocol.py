@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""DWIN T5L serial frame encoding.
+
+Frames are ``5A A5 LEN CMD VP(2) DATA`` where LEN counts everything after
+itself. Displays configured with CRC append a CRC-16/MODBUS of CMD..DATA
+(low byte first) and count it in LEN.
+
+FrameBuilder packs frames into one preallocated buffer with
+``struct.pack_into`` and hands out memoryviews of it, so the per-cycle
+display path does not build intermediate bytes objects.
+"""
+import struct
+
+# -------------------------------------------------
+# CONSTANTS
+# -------------------------------------------------
+HEADER = b"\x5a\xa5"
+CMD_WRITE = 0x82
+CMD_READ = 0x83
+VP_PAGE = 0x0084
+VP_PIC_NOW = 0x0014     # page currently shown (read only)
+PAGE_MAGIC = 0x5A01
+
+# LEN is one byte: cmd + VP + data (+ CRC) must fit
+MAX_WORDS = (0xFF - 3 - 2) // 2
+
+_READ = struct.Struct(">HBBHB")     # header, len, cmd, vp, count
+_CRC = struct.Struct("<H")
+_WRITES = {}
+
+
+def _write_struct(nwords):
+    """header, len, cmd, vp and nwords data words, cached per size."""
+    st = _WRITES.get(nwords)
+    if st is None:
+        st = _WRITES[nwords] = struct.Struct(">HBBH%dH" % nwords)
+    return st
+
+
+# -------------------------------------------------
+# CRC
+# -------------------------------------------------
+
+
+def _crc_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    table = _CRC_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+# -------------------------------------------------
+# BUILDER
+# -------------------------------------------------
+
+
+class FrameBuilder:
+    def __init__(self, crc=False, capacity=512):
+        self.crc = crc
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.size = 0
+
+    def reset(self):
+        self.size = 0
+
+    def frames(self):
+        """Everything built since reset()."""
+        return self.view[:self.size]
+
+    def _reserve(self, nbytes):
+        need = self.size + nbytes
+        if need > len(self.buf):
+            # Grow once; later cycles reuse the bigger buffer
+            self.view.release()
+            self.buf.extend(bytes(max(need, 2 * len(self.buf)) -
+                                  len(self.buf)))
+            self.view = memoryview(self.buf)
+
+    def _end_frame(self, start):
+        if self.crc:
+            body = self.view[start + 3:self.size]
+            _CRC.pack_into(self.buf, self.size, crc16(body))
+            body.release()
+            self.size += 2
+
+    def put_write(self, vp, words):
+        """Append a 0x82 frame writing words from vp onwards."""
+        st = _WRITES.get(len(words)) or _write_struct(len(words))
+        trailer = 2 if self.crc else 0
+        start = self.size
+        if start + st.size + trailer > len(self.buf):
+            self._reserve(st.size + trailer)
+        st.pack_into(self.buf, start, 0x5AA5, st.size - 3 + trailer,
+                     CMD_WRITE, vp, *words)
+        self.size = start + st.size
+        if trailer:
+            self._end_frame(start)
+
+    def write_words(self, vp, words):
+        start = self.size
+        self.put_write(vp, words)
+        return self.view[start:self.size]
+
+    def read_request(self, vp, count=1):
+        trailer = 2 if self.crc else 0
+        self._reserve(_READ.size + trailer)
+        start = self.size
+        _READ.pack_into(self.buf, start, 0x5AA5, 4 + trailer,
+                        CMD_READ, vp, count)
+        self.size += _READ.size
+        self._end_frame(start)
+        return self.view[start:self.size]
+
+    def page_switch(self, page_id):
+        return self.write_words(VP_PAGE, (PAGE_MAGIC, page_id))
+
+
+# -------------------------------------------------
+# DECODER
+# -------------------------------------------------
+
+
+class FrameDecoder:
+    """Incremental parser for what the display sends back.
+
+    feed() takes bytes as they arrive and keeps any partial frame for the
+    next call. 0x83 frames (read replies and auto-uploaded touch input)
+    are checked for length, word count and CRC, then passed as
+    ``handler(vp, words)`` to the handler registered with on_vp() or to
+    ``default``. Write acknowledgements are only counted; anything that
+    does not parse is skipped byte by byte until the next header.
+    """
+
+    def __init__(self, crc=False, default=None):
+        self.crc = crc
+        self.default = default
+        self.handlers = {}
+        self.buf = bytearray()
+        self.frames = 0
+        self.acks = 0
+        self.bad_bytes = 0
+        self.crc_errors = 0
+
+    def on_vp(self, vp, handler):
+        self.handlers[vp] = handler
+
+    def reset(self):
+        self.buf.clear()
+
+    def feed(self, data):
+        buf = self.buf
+        buf += data
+        trailer = 2 if self.crc else 0
+        while True:
+            start = buf.find(HEADER)
+            if start < 0:
+                keep = 1 if buf[-1:] == HEADER[:1] else 0
+                self.bad_bytes += len(buf) - keep
+                del buf[:len(buf) - keep]
+                return
+            if start:
+                self.bad_bytes += start
+                del buf[:start]
+            if len(buf) < 3:
+                return
+            end = 3 + buf[2]
+            if buf[2] < 3 + trailer:
+                self._skip()
+                continue
+            if len(buf) < end:
+                return
+            frame = bytes(buf[:end])
+            if trailer:
+                if crc16(frame[3:-2]) != _CRC.unpack_from(frame, end - 2)[0]:
+                    self.crc_errors += 1
+                    self._skip()
+                    continue
+                frame = frame[:-2]
+            if not self._dispatch(frame):
+                self._skip()
+                continue
+            del buf[:end]
+
+    def _skip(self):
+        # Not a frame after all: resync on the next header
+        self.bad_bytes += 1
+        del self.buf[:1]
+
+    def _dispatch(self, frame):
+        cmd = frame[3]
+        if cmd == CMD_WRITE:
+            if frame[4:] != b"OK":
+                return False
+            self.frames += 1
+            self.acks += 1
+            return True
+        if cmd != CMD_READ or len(frame) < 7:
+            return False
+        count = frame[6]
+        if len(frame) != 7 + 2 * count:
+            return False
+        self.frames += 1
+        vp = (frame[4] << 8) | frame[5]
+        words = struct.unpack_from(">%dH" % count, frame, 7)
+        handler = self.handlers.get(vp, self.default)
+        if handler:
+            handler(vp, words)
+        return True
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Virtual DWIN display on a pseudo-terminal.
+
+Decodes the 5A A5 frames the scripts send to /dev/serial0: 0x82 writes go
+into a VP memory map (a write to 0x0084 switches the page), 0x83 reads are
+answered from the same map. Every frame is counted and, with ``record``,
+kept in a timestamped log so display update latency and link bytes per
+second can be measured without the panel:
+
+    ./dwin_sim.py --link /tmp/ttyDWIN --select 1.5:1
+    DWIN_PORT=/tmp/ttyDWIN ./pam_to_dwin.py
+
+``--select DELAY:VALUE`` plays the operator on the mode-mismatch page: the
+given value is stored in VP 0x5100 that many seconds after page 28 opens.
+With ``--crc`` frames must carry a valid CRC-16 and replies get one too.
+"""
+import argparse
+import os
+import select
+import threading
+import time
+import tty
+from collections import Counter
+
+from dwin_protocol import (CMD_READ, CMD_WRITE, HEADER, PAGE_MAGIC, VP_PAGE,
+                           VP_PIC_NOW, crc16)
+
+# -------------------------------------------------
+# CONFIGURATION
+# -------------------------------------------------
+VP_SELECT = 0x5100
+PAGE_MISMATCH = 28
+
+
+# -------------------------------------------------
+# FRAME RECORD
+# -------------------------------------------------
+
+
+class Frame:
+    __slots__ = ("t", "cmd", "vp", "words", "size")
+
+    def __init__(self, t, cmd, vp, words, size):
+        self.t = t
+        self.cmd = cmd
+        self.vp = vp
+        self.words = words
+        self.size = size
+
+    def __repr__(self):
+        words = " ".join(f"{w:04X}" for w in self.words)
+        return (f"Frame({self.t:.4f}, {self.cmd:02X}, "
+                f"{self.vp:04X}, [{words}], {self.size} B)")
+
+
+# -------------------------------------------------
+# EMULATOR
+# -------------------------------------------------
+
+
+class DwinEmulator:
+    def __init__(self, ack=True, auto_upload=False, select_after=None,
+                 link=None, record=False, crc=False):
+        self.ack = ack
+        self.crc = crc
+        self.auto_upload = auto_upload
+        self.select_after = select_after
+        self.link = link
+        self.record = record
+
+        self.master = None
+        self.slave = None
+        self.path = None
+
+        self.memory = {VP_PIC_NOW: 0}
+        self.page = 0
+        self.pages = []
+        self.frames = []
+        self.vp_writes = Counter()
+        self.bytes_rx = 0
+        self.bytes_tx = 0
+        self.frames_rx = 0
+        self.bad_bytes = 0
+        self.crc_errors = 0
+
+        self._select_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = time.monotonic()
+
+    # ---------------- pty ----------------
+
+    def open(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        if self.link:
+            try:
+                os.unlink(self.link)
+            except FileNotFoundError:
+                pass
+            os.symlink(self.path, self.link)
+        return self.link or self.path
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+        if self.link:
+            try:
+                os.unlink(self.link)
+            except FileNotFoundError:
+                pass
+
+    def _send(self, data):
+        os.write(self.master, data)
+        self.bytes_tx += len(data)
+
+    def _send_frame(self, body):
+        """Send CMD..DATA with header, length and (if enabled) CRC."""
+        if self.crc:
+            body += crc16(body).to_bytes(2, "little")
+        self._send(HEADER + bytes([len(body)]) + body)
+
+    def elapsed(self):
+        return time.monotonic() - self._t0
+
+    # ---------------- touch panel ----------------
+
+    def touch(self, vp, value):
+        """Operator input: store value in vp, uploading it if enabled."""
+        with self._lock:
+            self.memory[vp] = value & 0xFFFF
+        if self.auto_upload:
+            self._send_frame(bytes([CMD_READ]) + vp.to_bytes(2, "big") +
+                             b"\x01" + (value & 0xFFFF).to_bytes(2, "big"))
+
+    # ---------------- decoding ----------------
+
+    def _on_write(self, vp, words):
+        with self._lock:
+            for i, w in enumerate(words):
+                self.memory[vp + i] = w
+                self.vp_writes[vp + i] += 1
+        if vp == VP_PAGE and len(words) >= 2 and words[0] == PAGE_MAGIC:
+            self.page = words[1]
+            with self._lock:
+                self.memory[VP_PIC_NOW] = self.page
+            self.pages.append((self.elapsed(), self.page))
+            if self.page == PAGE_MISMATCH and self.select_after:
+                self._select_at = self.elapsed() + self.select_after[0]
+        if self.ack:
+            self._send_frame(bytes([CMD_WRITE]) + b"OK")
+
+    def _on_read(self, vp, count):
+        with self._lock:
+            words = [self.memory.get(vp + i, 0) for i in range(count)]
+        body = bytes([CMD_READ]) + vp.to_bytes(2, "big") + bytes([count])
+        body += b"".join(w.to_bytes(2, "big") for w in words)
+        self._send_frame(body)
+
+    def feed(self, buf):
+        """Consume complete frames from buf, return the unparsed tail."""
+        while True:
+            start = buf.find(HEADER)
+            if start < 0:
+                keep = 1 if buf.endswith(HEADER[:1]) else 0
+                self.bad_bytes += len(buf) - keep
+                return buf[len(buf) - keep:]
+            self.bad_bytes += start
+            buf = buf[start:]
+            if len(buf) < 3:
+                return buf
+            end = 3 + buf[2]
+            if len(buf) < end:
+                return buf
+            frame, buf = buf[:end], buf[end:]
+            self._on_frame(frame)
+
+    def _on_frame(self, frame):
+        self.frames_rx += 1
+        self.bytes_rx += len(frame)
+        if self.crc:
+            if len(frame) < 6 or crc16(frame[3:-2]) != \
+                    int.from_bytes(frame[-2:], "little"):
+                self.crc_errors += 1
+                return
+            frame = frame[:-2]
+        cmd = frame[3]
+        vp = int.from_bytes(frame[4:6], "big") if len(frame) >= 6 else 0
+        payload = frame[6:]
+        words = []
+
+        if cmd == CMD_WRITE:
+            words = [int.from_bytes(payload[i:i + 2], "big")
+                     for i in range(0, len(payload) - 1, 2)]
+            self._on_write(vp, words)
+        elif cmd == CMD_READ:
+            # Without a word count the panel reads one word
+            self._on_read(vp, payload[0] if payload else 1)
+
+        if self.record:
+            self.frames.append(
+                Frame(self.elapsed(), cmd, vp, words, len(frame)))
+
+    # ---------------- serving ----------------
+
+    def serve(self):
+        buf = b""
+        while not self._stop.is_set():
+            if self._select_at is not None and \
+                    self.elapsed() >= self._select_at:
+                self._select_at = None
+                self.touch(VP_SELECT, self.select_after[1])
+
+            ready, _, _ = select.select([self.master], [], [], 0.01)
+            if not ready:
+                continue
+            try:
+                buf += os.read(self.master, 4096)
+            except OSError:
+                continue
+            buf = self.feed(buf)
+
+    def start(self):
+        if self.master is None:
+            self.open()
+        self._t0 = time.monotonic()
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+        return self.link or self.path
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(1.0)
+        self.close()
+
+    def summary(self):
+        t = max(self.elapsed(), 1e-9)
+        return {
+            "seconds": round(t, 3),
+            "frames_rx": self.frames_rx,
+            "bytes_rx": self.bytes_rx,
+            "bytes_per_s": round(self.bytes_rx / t, 1),
+            "bytes_tx": self.bytes_tx,
+            "bad_bytes": self.bad_bytes,
+            "crc_errors": self.crc_errors,
+            "page": self.page,
+            "vp_writes": {f"0x{vp:04X}": n
+                          for vp, n in sorted(self.vp_writes.items())},
+        }
+
+
+# -------------------------------------------------
+# CLI
+# -------------------------------------------------
+
+
+def parse_select(text):
+    delay, value = text.split(":")
+    return float(delay), int(value, 0)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Virtual DWIN display on a pty")
+    p.add_argument("--link", help="symlink to the pty slave, e.g. /tmp/ttyDWIN")
+    p.add_argument("--no-ack", action="store_true",
+                   help="do not answer 0x82 writes with 'OK'")
+    p.add_argument("--auto-upload", action="store_true",
+                   help="push touch input as 0x83 frames")
+    p.add_argument("--select", type=parse_select, metavar="DELAY:VALUE",
+                   help="answer page 28 by writing VALUE to VP 0x5100")
+    p.add_argument("--crc", action="store_true",
+                   help="expect and send CRC-16 on every frame")
+    p.add_argument("--verbose", action="store_true",
+                   help="print every received frame")
+    args = p.parse_args()
+
+    emu = DwinEmulator(ack=not args.no_ack, auto_upload=args.auto_upload,
+                       select_after=args.select, link=args.link,
+                       record=args.verbose, crc=args.crc)
+    print("✅ DWIN sim on", emu.start())
+    shown = 0
+    try:
+        while True:
+            time.sleep(1)
+            if args.verbose:
+                for frame in emu.frames[shown:]:
+                    print(frame)
+                shown = len(emu.frames)
+            print("📊", emu.summary())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emu.stop()
+        print("\n--- DWIN SIM STOPPED ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Fixed-size history of committed samples, for BLE backfill.
+
+HistoryRing keeps the last ``capacity`` samples (monotonic time, WA, WB,
+IA, IB) in preallocated ``array`` columns, 16 bytes per sample: one
+million samples, a few hours at full loop rate, take 16 MB and never
+more. WA/WB are stored x1000 and IA/IB raw, as in ble_telemetry.
+
+blocks() cuts a time range into zlib-compressed blocks that can be
+decoded on their own:
+
+    u32   time of the first sample, ms (same clock as the BLE stream)
+    then per sample: u16 ms since the previous one, i16 WA, WB, IA, IB
+
+packets() splits blocks into notifications of at most the ATT payload:
+``u8 kind, u16 block, u8 part, u8 parts`` plus a slice of the block.
+kind is 1 for data; a final kind 2 packet carries the block count.
+
+append() runs on the acquisition thread and blocks() on the BLE one, so
+both hold the ring's lock while they touch the columns. blocks() only
+holds it to copy one block's samples, never while compressing.
+"""
+import bisect
+import struct
+import threading
+import zlib
+from array import array
+
+from ble_telemetry import ATT_HEADER, DEFAULT_MTU, MISSING, fixed_point
+
+DEFAULT_CAPACITY = 1000000
+BLOCK_SAMPLES = 256
+
+_BLOCK_HEAD = struct.Struct("<I")
+_SAMPLE = struct.Struct("<Hhhhh")
+_PACKET = struct.Struct("<BHBB")
+KIND_DATA = 1
+KIND_END = 2
+
+
+class _Times:
+    """Sequence view of the ring's timestamps in age order (for bisect)."""
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def __len__(self):
+        return self.ring.count
+
+    def __getitem__(self, i):
+        ring = self.ring
+        return ring.t[(ring.start + i) % ring.capacity]
+
+
+class HistoryRing:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.t = array("d", bytes(8 * capacity))
+        self.wa = array("h", bytes(2 * capacity))
+        self.wb = array("h", bytes(2 * capacity))
+        self.ia = array("h", bytes(2 * capacity))
+        self.ib = array("h", bytes(2 * capacity))
+        self.start = 0
+        self.count = 0
+        # Samples ever appended: absolute index of the newest + 1
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, wa, wb, ia, ib):
+        wa = fixed_point(wa, 1000)
+        wb = fixed_point(wb, 1000)
+        ia = fixed_point(ia)
+        ib = fixed_point(ib)
+        with self.lock:
+            if self.count < self.capacity:
+                i = (self.start + self.count) % self.capacity
+                self.count += 1
+            else:
+                # Full: overwrite the oldest sample
+                i = self.start
+                self.start = (self.start + 1) % self.capacity
+            self.t[i] = t
+            self.wa[i] = wa
+            self.wb[i] = wb
+            self.ia[i] = ia
+            self.ib[i] = ib
+            self.total += 1
+
+    def oldest(self):
+        return self.t[self.start] if self.count else None
+
+    def newest(self):
+        if not self.count:
+            return None
+        return self.t[(self.start + self.count - 1) % self.capacity]
+
+    def span(self, t0, t1):
+        """Logical index range [lo, hi) of samples with t0 <= t <= t1."""
+        with self.lock:
+            return self._span(t0, t1)
+
+    def _span(self, t0, t1):
+        times = _Times(self)
+        return bisect.bisect_left(times, t0), bisect.bisect_right(times, t1)
+
+    def _copy(self, first, last):
+        """Samples first..last-1 (absolute indexes) still in the ring."""
+        with self.lock:
+            oldest = self.total - self.count
+            cap = self.capacity
+            rows = []
+            for k in range(max(first, oldest) - oldest, last - oldest):
+                i = (self.start + k) % cap
+                rows.append((self.t[i], self.wa[i], self.wb[i],
+                             self.ia[i], self.ib[i]))
+            return rows
+
+    def blocks(self, t0, t1, block_samples=BLOCK_SAMPLES):
+        """Yield compressed blocks covering t0..t1 (seconds, monotonic).
+
+        Samples overwritten while the transfer runs are left out.
+        """
+        with self.lock:
+            lo, hi = self._span(t0, t1)
+            base = self.total - self.count
+        for first in range(base + lo, base + hi, block_samples):
+            rows = self._copy(first, min(base + hi, first + block_samples))
+            if not rows:
+                continue
+            raw = bytearray(_BLOCK_HEAD.size + len(rows) * _SAMPLE.size)
+            prev = int(rows[0][0] * 1000)
+            _BLOCK_HEAD.pack_into(raw, 0, prev & 0xFFFFFFFF)
+            offset = _BLOCK_HEAD.size
+            for t, wa, wb, ia, ib in rows:
+                ms = int(t * 1000)
+                # Gaps longer than the u16 field are cut short
+                _SAMPLE.pack_into(raw, offset,
+                                  max(0, min(0xFFFF, ms - prev)),
+                                  wa, wb, ia, ib)
+                prev = ms
+                offset += _SAMPLE.size
+            yield zlib.compress(bytes(raw), 6)
+
+
+def packets(blocks, mtu=DEFAULT_MTU):
+    """Notification payloads for an iterable of blocks."""
+    room = max(DEFAULT_MTU, mtu) - ATT_HEADER - _PACKET.size
+    n = 0
+    for n, block in enumerate(blocks, 1):
+        parts = (len(block) + room - 1) // room
+        if parts > 0xFF:
+            raise ValueError("block too large for this MTU")
+        for part in range(parts):
+            yield _PACKET.pack(KIND_DATA, (n - 1) & 0xFFFF, part, parts) + \
+                block[part * room:(part + 1) * room]
+    yield _PACKET.pack(KIND_END, n & 0xFFFF, 0, 0)
+
+
+def decode_block(data):
+    """Inverse of one blocks() item: [(t_ms, WA, WB, IA, IB), ...]."""
+    raw = zlib.decompress(data)
+    (t,) = _BLOCK_HEAD.unpack_from(raw)
+    out = []
+    for offset in range(_BLOCK_HEAD.size, len(raw), _SAMPLE.size):
+        dt, wa, wb, ia, ib = _SAMPLE.unpack_from(raw, offset)
+        t += dt
+        out.append((t, None if wa == MISSING else wa / 1000,
+                    None if wb == MISSING else wb / 1000,
+                    None if ia == MISSING else ia,
+                    None if ib == MISSING else ib))
+    return out
@@ -1,3 +1,5 @@
+import 'dart:typed_data';
+
 import 'package:json_annotation/json_annotation.dart';
 import 'package:logger/logger.dart';
 
@@ -111,4 +113,33 @@ class MachineData {
       return MachineData();
     }
   }
+
+  /// Decodes the 12-byte record sent on the binary data characteristic
+  /// (version, flags, FUNC, WA/WB x1000, IA, IB; little-endian).
+  factory MachineData.fromBinary(List<int> bytes) {
+    const missing = -32768;
+    if (bytes.length < 12 || bytes[0] != 1) {
+      Logger().e("Unsupported binary packet (${bytes.length} bytes)");
+      return MachineData();
+    }
+    final data = ByteData.sublistView(Uint8List.fromList(bytes));
+    final flags = data.getUint8(1);
+
+    double value(int offset, [double scale = 1]) {
+      final raw = data.getInt16(offset, Endian.little);
+      return raw == missing ? 0.0 : raw / scale;
+    }
+
+    return MachineData(
+      func: data.getUint16(2, Endian.little).toString(),
+      inputA: value(4, 1000),
+      inputB: value(6, 1000),
+      coilA: value(8),
+      coilB: value(10),
+      mode: (flags & 0x02) == 0 ? '0' : ((flags & 0x01) != 0 ? 'C' : 'V'),
+      pin15: (flags & 0x04) != 0,
+      pin6: (flags & 0x08) != 0,
+      enableB: (flags & 0x10) != 0,
+    );
+  }
 }
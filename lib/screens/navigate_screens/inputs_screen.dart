@@ -58,15 +58,13 @@ class _InputScreenState extends ConsumerState<InputScreen> {
 
     String requestedInputHW = input1.toUpperCase();
     String currentInputHW = machineData.mode == 'V' ? 'VOLTAGE' : 'CURRENT';
-    if (modeChanged || requestedInputHW != currentInputHW) {
-      commandsToSend.add(requestedInputHW);
-    }
-
     if (selectedMode == '196') {
-      String requestedInput2HW = input2.toUpperCase();
-      if (requestedInput2HW != requestedInputHW) {
-        commandsToSend.add(requestedInput2HW);
-      }
+      // MachineData has no AINB mode, so write both inputs explicitly;
+      // this also clears an existing A/B mismatch
+      commandsToSend.add("AINA:$requestedInputHW");
+      commandsToSend.add("AINB:${input2.toUpperCase()}");
+    } else if (modeChanged || requestedInputHW != currentInputHW) {
+      commandsToSend.add("AINA:$requestedInputHW");
     }
 
     if (commandsToSend.isEmpty) {
@@ -127,8 +125,12 @@ class _InputScreenState extends ConsumerState<InputScreen> {
       if (inputsState.selectedInput1 != currentInput1) isDirty = true;
     }
     if (inputsState.selectedInput2 != null) {
+      // Input 2's hardware mode is not reported: any choice may differ
       final currentInput2 = machineData.mode == 'V' ? 'Voltage' : 'Current';
-      if (inputsState.selectedInput2 != currentInput2) isDirty = true;
+      if (displayMode == '196' ||
+          inputsState.selectedInput2 != currentInput2) {
+        isDirty = true;
+      }
     }
 
     return Scaffold(
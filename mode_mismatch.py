@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Operator workflow for AINA/AINB disagreeing under function 196.
+
+The display is switched to the mismatch page and the operator picks V or
+C there (VP 0x5100: 0 = V, 1 = C). Instead of blocking the main loop
+while waiting, MismatchWorkflow advances at most one step per call to
+step(), so PAM polling and DWIN/BLE telemetry carry on in between:
+
+    idle -> await selection -> verify -> idle
+
+The script supplies the I/O as callbacks:
+
+- show_page(retry): show the mismatch page and clear the selection VP;
+  remember the page shown before only when retry is False (on a retry
+  the mismatch page itself is showing)
+- request_selection(): ask the display for VP 0x5100 (polling mode)
+- apply_mode("V" | "C"): queue ``AINA x`` / ``AINB x``
+- reread_modes(): make the next poll read AINA/AINB again
+- restore_page(): go back to the page shown before
+"""
+
+IDLE = "idle"
+AWAIT = "await selection"
+VERIFY = "verify"
+
+SELECTIONS = {0: "V", 1: "C"}
+
+
+class MismatchWorkflow:
+    def __init__(self, show_page, request_selection, apply_mode,
+                 reread_modes, restore_page, poll_interval=0.15,
+                 verify_timeout=1.0, auto_upload=False):
+        self.show_page = show_page
+        self.request_selection = request_selection
+        self.apply_mode = apply_mode
+        self.reread_modes = reread_modes
+        self.restore_page = restore_page
+        self.poll_interval = poll_interval
+        self.verify_timeout = verify_timeout
+        self.auto_upload = auto_upload
+
+        self.state = IDLE
+        self.selected = None
+        self._next_request = 0.0
+        self._deadline = 0.0
+
+    @property
+    def active(self):
+        return self.state != IDLE
+
+    def cancel(self):
+        """Stop waiting, e.g. because FUNCTION is no longer 196."""
+        if self.state != IDLE:
+            self.restore_page()
+        self.state = IDLE
+
+    def step(self, now, mode_a, mode_b, selection=None):
+        """Advance by one step; selection is the VP 0x5100 value, if any
+        arrived since the last call."""
+        known = mode_a is not None and mode_b is not None
+        mismatch = known and mode_a != mode_b
+
+        if self.state == IDLE:
+            if mismatch:
+                print(f"⚠ AINA={mode_a} AINB={mode_b}: asking operator")
+                self.show_page(False)
+                self._await(now)
+            return
+
+        if self.state == AWAIT:
+            if known and not mismatch:
+                print(f"✅ AINA/AINB agree again ({mode_a})")
+                self._finish()
+            elif selection in SELECTIONS:
+                self.selected = SELECTIONS[selection]
+                print(f"👆 Operator selected {self.selected}")
+                self.apply_mode(self.selected)
+                self.reread_modes()
+                self.state = VERIFY
+                self._deadline = now + self.verify_timeout
+            elif not self.auto_upload and now >= self._next_request:
+                self.request_selection()
+                self._next_request = now + self.poll_interval
+            return
+
+        if self.state == VERIFY:
+            if known and not mismatch:
+                print(f"✅ AINA/AINB set to {mode_a}")
+                self._finish()
+            elif now >= self._deadline:
+                print("⚠ AINA/AINB still differ, asking again")
+                self.show_page(True)
+                self._await(now)
+
+    def _await(self, now):
+        self.state = AWAIT
+        self.selected = None
+        self._next_request = now
+
+    def _finish(self):
+        self.restore_page()
+        self.state = IDLE
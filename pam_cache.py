@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""In-memory copy of the PAM configuration registers.
+
+FUNCTION, AINA, AINB and MODE only change when someone reconfigures the
+amplifier, so the main loop reads them from here instead of the serial
+port. An entry is dropped (and re-read on the next poll) when the port is
+reopened, when a write command such as ``AINA V`` touches it, or when the
+scheduler's slow verification read returns something different.
+"""
+
+CONFIG_REGISTERS = ("FUNCTION", "AINA", "AINB", "MODE")
+
+
+class RegisterCache:
+    def __init__(self, names=CONFIG_REGISTERS):
+        self.names = tuple(names)
+        self.values = {}
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def store(self, name, value):
+        """Remember a freshly read value; True if it differs from before."""
+        old = self.values.get(name)
+        self.values[name] = value
+        return old is not None and old != value
+
+    def invalidate(self, *names):
+        if not names:
+            self.values.clear()
+            return
+        for name in names:
+            self.values.pop(name, None)
+
+    def written(self, cmd):
+        # "AINA V" sets AINA; a bare "AINA" is only a read
+        parts = cmd.split()
+        if len(parts) > 1 and parts[0] in self.names:
+            self.invalidate(parts[0])
+
+    def missing(self, names=None):
+        names = self.names if names is None else names
+        return [n for n in names if n in self.names and n not in self.values]
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""Request/response transport for the PAM amplifier serial console.
+
+A command is written as ``CMD\\r\\n`` and the reply is read until the PAM
+prints its ``>`` prompt (or, with ``terminator="eol"``, the first reply
+line), so a command costs exactly as long as the amplifier takes to answer
+instead of a fixed sleep. ``query_many()`` pipelines several commands in a
+single write and splits the replies back apart by prompt.
+
+If ``PAM_STATS_FILE`` is set in the environment, round-trip times per
+command (1 ms buckets) and reply status counts are written there as JSON
+when the process exits; bench.py uses this.
+"""
+import atexit
+import json
+import os
+import select
+import time
+from collections import Counter, defaultdict
+
+# -------------------------------------------------
+# CONFIGURATION
+# -------------------------------------------------
+PAM_PROMPT = b">"
+PAM_CMD_TIMEOUT = 0.15
+
+# Reply status
+OK = "ok"
+PARTIAL = "partial"
+TIMEOUT = "timeout"
+
+# -------------------------------------------------
+# STATISTICS
+# -------------------------------------------------
+STATS_FILE = os.environ.get("PAM_STATS_FILE")
+
+rtt_histogram = defaultdict(Counter)
+status_counts = Counter()
+
+
+def _record(resp):
+    rtt_histogram[resp.cmd][int(resp.rtt * 1000)] += 1
+    status_counts[resp.status] += 1
+
+
+def _dump_stats():
+    with open(STATS_FILE, "w") as f:
+        json.dump({
+            "rtt_ms": {cmd: dict(sorted(hist.items()))
+                       for cmd, hist in rtt_histogram.items()},
+            "status": dict(status_counts),
+        }, f)
+
+
+if STATS_FILE:
+    atexit.register(_dump_stats)
+
+
+# -------------------------------------------------
+# RESULT TYPE
+# -------------------------------------------------
+
+
+class PamResponse:
+    __slots__ = ("cmd", "text", "status", "rtt")
+
+    def __init__(self, cmd, text, status, rtt):
+        self.cmd = cmd
+        self.text = text
+        self.status = status
+        self.rtt = rtt
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    def __repr__(self):
+        return (f"PamResponse({self.cmd!r}, {self.text!r}, "
+                f"{self.status}, {self.rtt * 1000:.1f} ms)")
+
+
+# -------------------------------------------------
+# LINK
+# -------------------------------------------------
+
+
+class PamLink:
+    def __init__(self, port, timeout=PAM_CMD_TIMEOUT, terminator="prompt"):
+        if terminator not in ("prompt", "eol"):
+            raise ValueError(f"unknown terminator: {terminator}")
+        self.port = port
+        self.timeout = timeout
+        self.terminator = terminator
+
+    def close(self):
+        self.port.close()
+
+    def _reply_end(self, buf, cmd):
+        # Offset just past the first complete reply in buf, or -1
+        end = buf.find(PAM_PROMPT)
+        if end >= 0:
+            return end + len(PAM_PROMPT)
+        if self.terminator != "eol":
+            return -1
+        # Any newline-terminated line that is not the echo of the command
+        echo = cmd.encode()
+        pos = 0
+        while True:
+            nl = buf.find(b"\n", pos)
+            if nl < 0:
+                return -1
+            line = buf[pos:nl].strip()
+            if line and line != echo:
+                return nl + 1
+            pos = nl + 1
+
+    def _wait_readable(self, remaining):
+        select.select([self.port], [], [], remaining)
+
+    def query(self, cmd, timeout=None):
+        port = self.port
+        port.reset_input_buffer()
+
+        start = time.monotonic()
+        deadline = start + (self.timeout if timeout is None else timeout)
+        port.write((cmd + "\r\n").encode())
+
+        buf = bytearray()
+        while True:
+            waiting = port.in_waiting
+            if waiting:
+                buf += port.read(waiting)
+                if self._reply_end(buf, cmd) >= 0:
+                    status = OK
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                status = PARTIAL if buf else TIMEOUT
+                break
+            self._wait_readable(remaining)
+
+        resp = PamResponse(cmd, buf.decode(errors="ignore"), status,
+                           time.monotonic() - start)
+        if STATS_FILE:
+            _record(resp)
+        return resp
+
+    def query_many(self, cmds, timeout=None):
+        port = self.port
+        port.reset_input_buffer()
+
+        collector = ReplyCollector(
+            self, cmds, self.timeout if timeout is None else timeout)
+        port.write(encode_batch(cmds))
+
+        while not collector.done:
+            waiting = port.in_waiting
+            if waiting:
+                collector.feed(port.read(waiting), time.monotonic())
+                continue
+            remaining = collector.deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wait_readable(remaining)
+
+        return collector.finish(time.monotonic())
+
+
+# -------------------------------------------------
+# BATCH DEMULTIPLEXING
+# -------------------------------------------------
+
+
+def encode_batch(cmds):
+    return "".join(c + "\r\n" for c in cmds).encode()
+
+
+class ReplyCollector:
+    """Splits the reply stream of one pipelined batch back into replies.
+
+    Fed incrementally, so the blocking query_many() and a non-blocking
+    engine can share it. Each reply gets its own deadline, restarted
+    whenever the previous one completes.
+    """
+
+    def __init__(self, link, cmds, timeout, start=None):
+        self.link = link
+        self.cmds = list(cmds)
+        self.timeout = timeout
+        self.start = time.monotonic() if start is None else start
+        self.deadline = self.start + timeout
+        self.names = {c.split()[0] for c in cmds if c}
+        self.replies = []
+        self.buf = bytearray()
+
+    @property
+    def done(self):
+        return len(self.replies) == len(self.cmds)
+
+    def feed(self, data, now):
+        buf = self.buf
+        buf += data
+        # Hand out every reply that is complete so far
+        while not self.done:
+            cmd = self.cmds[len(self.replies)]
+            if self.replies and self.link.terminator == "eol":
+                # Late prompt of the previous reply
+                del buf[:len(buf) - len(buf.lstrip(b"> \r\n"))]
+            end = self.link._reply_end(buf, cmd)
+            if end < 0:
+                break
+            text = bytes(buf[:end]).decode(errors="ignore")
+            del buf[:end]
+            self.replies.append(PamResponse(cmd, text, OK, now - self.start))
+            self.deadline = now + self.timeout
+
+            if _echo_of_other(text, cmd, self.names):
+                # Lost a prompt somewhere: nothing after this lines up
+                self.replies[-1].status = PARTIAL
+                for cmd in self.cmds[len(self.replies):]:
+                    self.replies.append(
+                        PamResponse(cmd, "", PARTIAL, now - self.start))
+        return self.done
+
+    def finish(self, now):
+        replies = self.replies
+        elapsed = now - self.start
+        if not self.done:
+            replies.append(PamResponse(
+                self.cmds[len(replies)], self.buf.decode(errors="ignore"),
+                PARTIAL if self.buf else TIMEOUT, elapsed))
+            for cmd in self.cmds[len(replies):]:
+                replies.append(PamResponse(cmd, "", TIMEOUT, elapsed))
+        if STATS_FILE:
+            for resp in replies:
+                _record(resp)
+        return replies
+
+
+def _echo_of_other(text, cmd, names):
+    for line in text.splitlines():
+        tokens = line.replace(">", "").split()
+        if tokens:
+            return tokens[0] in names and tokens[0] != cmd.split()[0]
+    return False
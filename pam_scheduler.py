@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Per-register polling schedule for the PAM amplifier.
+
+Every register has its own poll interval that moves between a fast and a
+slow bound: each read that returns the same value (within the register's
+deadband) stretches the interval by ``BACKOFF``, and a read that moved
+snaps it back to the fast bound. Coil currents and setpoints therefore
+stream at full rate while they move, and configuration registers such as
+FUNCTION or AINA only cost a round trip every few seconds.
+"""
+
+# -------------------------------------------------
+# CONFIGURATION
+# -------------------------------------------------
+BACKOFF = 1.5
+BACKOFF_FLOOR = 0.01
+
+# name: (min interval s, max interval s, priority, deadband)
+POLL_REGISTERS = {
+    "IA": (0.0, 0.2, 0, 0.0),
+    "IB": (0.0, 0.2, 0, 0.0),
+    "WA": (0.05, 0.5, 1, 0.0),
+    "WB": (0.05, 0.5, 1, 0.0),
+    "W": (0.05, 0.5, 1, 0.0),
+    "FUNCTION": (1.0, 10.0, 2, 0.0),
+    "AINA": (1.0, 10.0, 2, 0.0),
+    "AINB": (1.0, 10.0, 2, 0.0),
+    "MODE": (3.0, 15.0, 3, 0.0),
+}
+
+# Registers worth polling for each PAM function
+FUNCTION_REGISTERS = {
+    196: ("FUNCTION", "MODE", "AINA", "AINB", "WA", "WB", "IA", "IB"),
+    195: ("FUNCTION", "MODE", "AINA", "W", "IA", "IB"),
+}
+DEFAULT_REGISTERS = ("FUNCTION", "MODE", "IA", "IB")
+
+
+def registers_for(function):
+    return FUNCTION_REGISTERS.get(function, DEFAULT_REGISTERS)
+
+
+# -------------------------------------------------
+# SCHEDULER
+# -------------------------------------------------
+
+
+class Register:
+    __slots__ = ("name", "min_interval", "max_interval", "priority",
+                 "deadband", "interval", "next_due", "value")
+
+    def __init__(self, name, min_interval, max_interval, priority=0,
+                 deadband=0.0):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.priority = priority
+        self.deadband = deadband
+        self.interval = min_interval
+        self.next_due = 0.0
+        self.value = None
+
+    def changed(self, value):
+        if self.value is None:
+            return True
+        if isinstance(value, (int, float)) and \
+                isinstance(self.value, (int, float)):
+            return abs(value - self.value) > self.deadband
+        return value != self.value
+
+
+class PollScheduler:
+    def __init__(self, registers=None):
+        if registers is None:
+            registers = POLL_REGISTERS
+        self.registers = {
+            name: Register(name, *cfg) for name, cfg in registers.items()
+        }
+
+    def due(self, now, active=None):
+        names = self.registers if active is None else active
+        regs = [self.registers[n] for n in names
+                if self.registers[n].next_due <= now]
+        regs.sort(key=lambda r: (r.priority, r.next_due))
+        return [r.name for r in regs]
+
+    def next_due(self, active=None):
+        names = self.registers if active is None else active
+        return min(self.registers[n].next_due for n in names)
+
+    def update(self, name, value, now):
+        reg = self.registers[name]
+        if value is None:
+            # Failed read: retry at the fast rate, keep the learnt interval
+            reg.next_due = now + reg.min_interval
+            return False
+
+        moved = reg.changed(value)
+        if moved:
+            reg.interval = reg.min_interval
+        else:
+            reg.interval = min(
+                reg.max_interval,
+                max(reg.interval, BACKOFF_FLOOR) * BACKOFF)
+        reg.value = value
+        reg.next_due = now + reg.interval
+        return moved
+
+    def poll_now(self, *names):
+        for name in names:
+            reg = self.registers[name]
+            reg.interval = reg.min_interval
+            reg.next_due = 0.0
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Virtual PAM amplifier on a pseudo-terminal.
+
+Opens a pty and answers the PAM console commands used by pam_to_dwin.py
+and pam_to_dwin_v2.py, so the polling loop can be run and measured on any
+Linux box:
+
+    ./pam_sim.py --function 196 --latency 0.005 --link /tmp/ttyPAM
+    PAM_PORT=/tmp/ttyPAM ./pam_to_dwin.py
+
+Every command is echoed, followed by its value and the ``>`` prompt.
+Latency, jitter, dropped bytes and a temporary outage (pty closed and
+recreated behind the same ``--link``) can be configured to reproduce slow
+or flaky amplifiers.
+"""
+import argparse
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import Counter
+
+# -------------------------------------------------
+# CONFIGURATION
+# -------------------------------------------------
+DEFAULT_LATENCY = 0.005
+DEFAULT_PERIOD = 4.0
+
+
+# -------------------------------------------------
+# SIMULATOR
+# -------------------------------------------------
+
+
+class PamSimulator:
+    def __init__(self, function=196, latency=DEFAULT_LATENCY, jitter=0.0,
+                 drop=0.0, echo=True, ain_a="V", ain_b="V", mode="STD",
+                 period=DEFAULT_PERIOD, outage=None, link=None, seed=None,
+                 record=False, verbose=False):
+        self.function = function
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.echo = echo
+        self.ain = {"AINA": ain_a, "AINB": ain_b}
+        self.mode = mode
+        self.period = period
+        self.outage = outage
+        self.link = link
+        self.rng = random.Random(seed)
+        self.record = record
+        self.verbose = verbose
+
+        self.master = None
+        self.slave = None
+        self.path = None
+        self.counts = Counter()
+        self.log = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = time.monotonic()
+
+    # ---------------- pty ----------------
+
+    def open(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        if self.link:
+            try:
+                os.unlink(self.link)
+            except FileNotFoundError:
+                pass
+            os.symlink(self.path, self.link)
+        return self.link or self.path
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+        if self.link:
+            try:
+                os.unlink(self.link)
+            except FileNotFoundError:
+                pass
+
+    # ---------------- registers ----------------
+
+    def _wave(self, t, shift=0.0):
+        if not self.period:
+            return 0.5
+        return 0.5 + 0.5 * math.sin(2 * math.pi * t / self.period + shift)
+
+    def value(self, reg, t):
+        if reg == "FUNCTION":
+            return str(self.function)
+        if reg in self.ain:
+            return self.ain[reg]
+        if reg == "MODE":
+            return self.mode
+        if reg in ("WA", "W"):
+            return str(int(10000 * self._wave(t)))
+        if reg == "WB":
+            return str(int(10000 * self._wave(t, math.pi / 2)))
+        if reg == "IA":
+            return str(int(8000 * self._wave(t)))
+        if reg == "IB":
+            return str(int(8000 * self._wave(t, math.pi / 2)))
+        return None
+
+    def handle(self, cmd, t):
+        parts = cmd.split()
+        if not parts:
+            return ""
+        reg = parts[0].upper()
+        if len(parts) == 1:
+            self.counts[reg] += 1
+            if self.record:
+                self.log.append((t, reg))
+            value = self.value(reg, t)
+            return "ERR" if value is None else value
+
+        arg = parts[1].upper()
+        self.counts[reg + " " + arg] += 1
+        if self.record:
+            self.log.append((t, reg + " " + arg))
+        if reg in self.ain and arg in ("V", "C"):
+            self.ain[reg] = arg
+            return arg
+        if reg == "MODE" and arg in ("STD", "EXP"):
+            self.mode = arg
+            return arg
+        if reg == "FUNCTION" and arg in ("195", "196"):
+            self.function = int(arg)
+            return arg
+        return "ERR"
+
+    # ---------------- serving ----------------
+
+    def _reply(self, cmd, t):
+        value = self.handle(cmd, t)
+        delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        text = (cmd + "\r\n" if self.echo else "") + value + "\r\n>"
+        data = bytes(b for b in text.encode()
+                     if not self.drop or self.rng.random() >= self.drop)
+        os.write(self.master, data)
+
+    def _in_outage(self, t):
+        if not self.outage:
+            return False
+        start, duration = self.outage
+        return start <= t < start + duration
+
+    def serve(self):
+        buf = b""
+        while not self._stop.is_set():
+            t = time.monotonic() - self._t0
+            if self._in_outage(t):
+                if self.master is not None:
+                    if self.verbose:
+                        print("🔌 PAM sim: outage")
+                    self.close()
+                time.sleep(0.01)
+                continue
+            if self.master is None:
+                path = self.open()
+                if self.verbose:
+                    print("🔌 PAM sim: back on", path)
+                buf = b""
+
+            ready, _, _ = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                buf += os.read(self.master, 4096)
+            except OSError:
+                continue
+            while b"\n" in buf or b"\r" in buf:
+                cut = min(i for i in (buf.find(b"\r"), buf.find(b"\n"))
+                          if i >= 0)
+                line, buf = buf[:cut], buf[cut + 1:]
+                cmd = line.decode(errors="ignore").strip()
+                if cmd:
+                    self._reply(cmd, time.monotonic() - self._t0)
+
+    def start(self):
+        if self.master is None:
+            self.open()
+        self._t0 = time.monotonic()
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+        return self.link or self.path
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(1.0)
+        self.close()
+
+
+# -------------------------------------------------
+# CLI
+# -------------------------------------------------
+
+
+def parse_outage(text):
+    start, duration = text.split(":")
+    return float(start), float(duration)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Virtual PAM amplifier on a pty")
+    p.add_argument("--function", type=int, default=196, choices=(195, 196))
+    p.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+                   help="reply delay in seconds")
+    p.add_argument("--jitter", type=float, default=0.0,
+                   help="+/- random extra delay in seconds")
+    p.add_argument("--drop", type=float, default=0.0,
+                   help="probability of dropping each reply byte")
+    p.add_argument("--no-echo", action="store_true",
+                   help="do not echo the command before the value")
+    p.add_argument("--aina", default="V", choices=("V", "C"))
+    p.add_argument("--ainb", default="V", choices=("V", "C"))
+    p.add_argument("--mode", default="STD", choices=("STD", "EXP"))
+    p.add_argument("--period", type=float, default=DEFAULT_PERIOD,
+                   help="setpoint/current waveform period, 0 = constant")
+    p.add_argument("--outage", type=parse_outage, metavar="START:SECONDS",
+                   help="close the pty for a while to simulate unplugging")
+    p.add_argument("--link", help="symlink to the pty slave, e.g. /tmp/ttyPAM")
+    p.add_argument("--seed", type=int)
+    args = p.parse_args()
+
+    sim = PamSimulator(function=args.function, latency=args.latency,
+                       jitter=args.jitter, drop=args.drop,
+                       echo=not args.no_echo, ain_a=args.aina,
+                       ain_b=args.ainb, mode=args.mode, period=args.period,
+                       outage=args.outage, link=args.link, seed=args.seed,
+                       verbose=True)
+    print("✅ PAM sim on", sim.start())
+    try:
+        while True:
+            time.sleep(5)
+            print("📊", dict(sim.counts))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+        print("\n--- PAM SIM STOPPED ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,45 @@
 #!/usr/bin/python3
 
+import os
 import serial
 import time
 
+from dwin_link import (DWIN_AUTO_UPLOAD, DWIN_CRC, DWIN_READ_INTERVAL,
+                       PAGE_MISMATCH, VP, VP_SELECT, DwinWriter)
+from dwin_protocol import VP_PIC_NOW, FrameBuilder, FrameDecoder
+from mode_mismatch import MismatchWorkflow
+from pam_cache import RegisterCache
+from pam_link import PamLink
+from pam_scheduler import PollScheduler, registers_for
+
 # -------------------------------------------------
 # CONFIGURATION
 # -------------------------------------------------
-PAM_PORT = "/dev/ttyUSB0"
-DWIN_PORT = "/dev/serial0"
+PAM_PORT = os.environ.get("PAM_PORT", "/dev/ttyUSB0")
+DWIN_PORT = os.environ.get("DWIN_PORT", "/dev/serial0")
 
 PAM_BAUD = 57600
 DWIN_BAUD = 115200
 
-PAM_CMD_DELAY = 0.06
+PAM_CMD_TIMEOUT = 0.15
 MAIN_LOOP_DELAY = 0.03
-MODE_CHECK_INTERVAL = 3.0
+DWIN_RETRY = 1.0
 
 # -------------------------------------------------
 # SERIAL OBJECTS
 # -------------------------------------------------
 pam = None
 dwin = None
+dwin_retry_at = 0.0
 
 pam_connected_once = False
-last_mode_check = 0
+
+scheduler = PollScheduler()
+pam_values = {}
+config_cache = RegisterCache()
+
+# Latest values the operator entered on the DWIN, by VP
+dwin_inputs = {}
 
 # -------------------------------------------------
 # SERIAL INIT / RECONNECT
@@ -34,10 +50,12 @@ def open_pam():
     global pam, pam_connected_once
     while True:
         try:
-            pam = serial.Serial(PAM_PORT, PAM_BAUD,
-                                timeout=0.15, write_timeout=0.15)
+            pam = PamLink(serial.Serial(PAM_PORT, PAM_BAUD,
+                                        timeout=0.15, write_timeout=0.15),
+                          timeout=PAM_CMD_TIMEOUT)
             time.sleep(0.5)
             pam_connected_once = False
+            config_cache.invalidate()
             print("✅ PAM connected")
             return
         except Exception:
@@ -57,6 +75,27 @@ def open_dwin():
             time.sleep(1)
 
 
+def reopen_dwin():
+    """One reconnect attempt, at most every DWIN_RETRY seconds."""
+    global dwin, dwin_retry_at
+    now = time.monotonic()
+    if now < dwin_retry_at:
+        return
+    dwin_retry_at = now + DWIN_RETRY
+    try:
+        dwin.close()
+    except Exception:
+        pass
+    try:
+        dwin = serial.Serial(DWIN_PORT, DWIN_BAUD, timeout=0.2)
+    except Exception:
+        return
+    print("✅ DWIN reconnected")
+    dwin_rx.reset()
+    # The display may have rebooted: send it everything again
+    dwin_writer.resync()
+
+
 def reopen_pam():
     global pam
     try:
@@ -77,16 +116,40 @@ open_dwin()
 
 def pam_cmd(cmd):
     global pam
+    config_cache.written(cmd)
     try:
-        pam.reset_input_buffer()
-        pam.write((cmd + "\r\n").encode())
-        time.sleep(PAM_CMD_DELAY)
-        return pam.read(pam.in_waiting or 1).decode(errors="ignore")
+        resp = pam.query(cmd)
     except Exception as e:
         print("❌ PAM ERROR:", e)
         reopen_pam()
         return ""
 
+    if not resp.ok:
+        print(f"⚠ PAM {resp.status} reply to {cmd} "
+              f"after {resp.rtt * 1000:.0f} ms")
+        return ""
+    return resp.text
+
+
+def pam_cmds(cmds):
+    global pam
+    for cmd in cmds:
+        config_cache.written(cmd)
+    try:
+        replies = pam.query_many(cmds)
+    except Exception as e:
+        print("❌ PAM ERROR:", e)
+        reopen_pam()
+        return [""] * len(cmds)
+
+    texts = []
+    for resp in replies:
+        if not resp.ok:
+            print(f"⚠ PAM {resp.status} reply to {resp.cmd} "
+                  f"after {resp.rtt * 1000:.0f} ms")
+        texts.append(resp.text if resp.ok else "")
+    return texts
+
 
 def extract_number(resp):
     for t in resp.replace(">", "").split():
@@ -97,6 +160,11 @@ def extract_number(resp):
     return None
 
 
+def extract_function(resp):
+    func = extract_number(resp)
+    return int(func) if func is not None else None
+
+
 def extract_mode(resp):
     if "V" in resp:
         return "V"
@@ -117,17 +185,14 @@ def extract_pam_mode(resp):
 # -------------------------------------------------
 
 
-def ensure_std_mode():
+def ensure_std_mode(mode):
     global pam_connected_once
-    resp = pam_cmd("MODE")
-    mode = extract_pam_mode(resp)
-
     if mode == "EXP":
+        # The write drops MODE from the cache, so it is verified next cycle
         pam_cmd("MODE STD")
-        time.sleep(0.1)
-        pam_cmd("MODE")
+        return
 
-    if not pam_connected_once:
+    if mode == "STD" and not pam_connected_once:
         print("✔ PAM MODE verified as STD")
         pam_connected_once = True
 
@@ -135,82 +200,141 @@ def ensure_std_mode():
 # -------------------------------------------------
 # DWIN FUNCTIONS
 # -------------------------------------------------
-cache = {}
+dwin_writer = DwinWriter()
+# One-off frames (page switch, VP reads) reuse this buffer
+dwin_frames = FrameBuilder(crc=DWIN_CRC)
 
 
 def send_to_dwin(vpin, value):
-    try:
-        iv = int(round(value * 10))
-        iv = max(-32768, min(32767, iv))
+    if value is None:
+        # Not scalable yet, e.g. AINA/AINB still being re-read
+        return
+    iv = int(round(value * 10))
+    iv = max(-32768, min(32767, iv))
+    dwin_writer.set(vpin, iv)
 
-        if cache.get(vpin) == iv:
-            return
 
-        cache[vpin] = iv
+def send_mode_to_dwin(mode):
+    mode_val = 0 if mode == "V" else 1
+    dwin_writer.set(VP["MODE"], mode_val)
+
 
-        packet = (
-            bytes([0x5A, 0xA5, 0x05, 0x82]) +
-            vpin.to_bytes(2, "big") +
-            iv.to_bytes(2, "big", signed=True)
-        )
-        dwin.write(packet)
+def flush_dwin():
+    # One write() per cycle, adjacent VPs merged into one frame
+    try:
+        dwin_writer.flush(dwin)
     except Exception as e:
         print("❌ DWIN ERR:", e)
+        reopen_dwin()
 
 
-def send_mode_to_dwin(mode):
+def send_dwin_frames():
     try:
-        mode_val = 0 if mode == "V" else 1
-        packet = bytes([0x5A, 0xA5, 0x05, 0x82, 0x50, 0x00]) + \
-            mode_val.to_bytes(2, "big")
-        dwin.write(packet)
-    except Exception:
-        pass
+        dwin.write(dwin_frames.frames())
+    except Exception as e:
+        print("❌ DWIN ERR:", e)
+        reopen_dwin()
 
 
 def switch_page(page_id):
-    frame = bytes([
-        0x5A, 0xA5, 0x07, 0x82,
-        0x00, 0x84, 0x5A, 0x01,
-        (page_id >> 8) & 0xFF,
-        page_id & 0xFF
-    ])
-    dwin.write(frame)
-    dwin.flush()
-    time.sleep(0.05)
-    dwin.reset_input_buffer()
+    dwin_frames.reset()
+    dwin_frames.page_switch(page_id)
+    send_dwin_frames()
+    # New page: make sure it shows every current value
+    dwin_writer.resync()
     print(f"📄 Switched to page {page_id}")
 
 # -------------------------------------------------
-# VP5100 POLLING
+# DWIN INPUT
 # -------------------------------------------------
 
 
-def read_vp_5100_polling(timeout=2.0):
-    start = time.time()
-    buffer = b""
-    cmd = bytes([0x5A, 0xA5, 0x03, 0x83, 0x51, 0x00])
+def on_dwin_input(vp, words):
+    # Read replies and auto-uploaded touch input alike
+    dwin_inputs[vp] = words[0] if words else None
 
-    dwin.reset_input_buffer()
 
-    while time.time() - start < timeout:
-        dwin.write(cmd)
-        t0 = time.time()
-        while time.time() - t0 < 0.15:
-            if dwin.in_waiting:
-                buffer += dwin.read(dwin.in_waiting)
-                if len(buffer) >= 8:
-                    return (buffer[-2] << 8) | buffer[-1]
-            time.sleep(0.01)
-    return None
+dwin_rx = FrameDecoder(crc=DWIN_CRC, default=on_dwin_input)
+
+
+def pump_dwin():
+    """Feed whatever the display has sent so far to dwin_rx."""
+    try:
+        waiting = dwin.in_waiting
+        if waiting:
+            dwin_rx.feed(dwin.read(waiting))
+    except Exception as e:
+        print("❌ DWIN ERR:", e)
+
+
+# -------------------------------------------------
+# MODE MISMATCH (PAGE 28)
+# -------------------------------------------------
+
+
+def show_mismatch_page(retry=False):
+    dwin_inputs.pop(VP_SELECT, None)
+    dwin_frames.reset()
+    if not retry:
+        # Remember the page shown now; on a retry that is page 28 itself
+        dwin_inputs.pop(VP_PIC_NOW, None)
+        dwin_frames.read_request(VP_PIC_NOW)
+    # Clear any old selection first
+    dwin_frames.write_words(VP_SELECT, (0xFFFF,))
+    dwin_frames.page_switch(PAGE_MISMATCH)
+    send_dwin_frames()
+    dwin_writer.resync()
+    print(f"📄 Switched to page {PAGE_MISMATCH}")
+
+
+def request_selection():
+    dwin_frames.reset()
+    dwin_frames.read_request(VP_SELECT)
+    send_dwin_frames()
+
+
+def apply_ain_mode(mode):
+    pam_cmds([f"AINA {mode}", f"AINB {mode}"])
+
+
+def reread_ain_modes():
+    config_cache.invalidate("AINA", "AINB")
+
+
+def restore_page():
+    page = dwin_inputs.pop(VP_PIC_NOW, None)
+    if page is None or page == PAGE_MISMATCH:
+        print("⚠ Previous DWIN page unknown, staying on mismatch page")
+        return
+    switch_page(page)
+
+
+mismatch = MismatchWorkflow(show_mismatch_page, request_selection,
+                            apply_ain_mode, reread_ain_modes, restore_page,
+                            poll_interval=DWIN_READ_INTERVAL,
+                            auto_upload=DWIN_AUTO_UPLOAD)
+
+
+def check_ain_modes(func, now):
+    """One step of the page-28 workflow; never blocks."""
+    if func != 196:
+        mismatch.cancel()
+        return
+    selection = dwin_inputs.pop(VP_SELECT, None) if mismatch.active else None
+    mismatch.step(now, config_cache.get("AINA"), config_cache.get("AINB"),
+                  selection)
 
 # -------------------------------------------------
 # SCALING
 # -------------------------------------------------
 
 
-def scale_value(raw, mode, function):
+def scale_value(raw, ain):
+    if raw is None:
+        return None
     raw = float(raw)
+    mode = config_cache.get(ain)
+    function = config_cache.get("FUNCTION")
     if mode == "V":
         return raw / 1000.0
     if mode == "C":
@@ -219,91 +343,114 @@ def scale_value(raw, mode, function):
         return min(20.0, max(4.0, (raw * 0.0008) + 12.0))
     return None
 
+# -------------------------------------------------
+# REGISTER POLLING
+# -------------------------------------------------
+
+
+PAM_PARSERS = {
+    "FUNCTION": extract_function,
+    "MODE": extract_pam_mode,
+    "AINA": extract_mode,
+    "AINB": extract_mode,
+    "WA": extract_number,
+    "WB": extract_number,
+    "W": extract_number,
+    "IA": extract_number,
+    "IB": extract_number,
+}
+
+
+def poll_pam(now):
+    active = registers_for(config_cache.get("FUNCTION"))
+    names = scheduler.due(now, active)
+    names += [n for n in config_cache.missing(active) if n not in names]
+    if not names:
+        return []
+
+    for name, resp in zip(names, pam_cmds(names)):
+        value = PAM_PARSERS[name](resp)
+        scheduler.update(name, value, now)
+        if value is None:
+            continue
+        if name not in config_cache:
+            pam_values[name] = value
+        elif config_cache.store(name, value):
+            print(f"🔧 PAM {name} changed to {value}")
+            if name == "FUNCTION":
+                config_cache.invalidate("AINA", "AINB")
+
+    if "MODE" in names:
+        ensure_std_mode(config_cache.get("MODE"))
+    return names
+
+
+def idle_until_due(now):
+    active = registers_for(config_cache.get("FUNCTION"))
+    wait = scheduler.next_due(active) - now
+    time.sleep(min(MAIN_LOOP_DELAY, max(0.0, wait)))
+
 
 # -------------------------------------------------
 # MAIN LOOP
 # -------------------------------------------------
 print("\n--- SYSTEM RUNNING (PAGE-28 ENABLED) ---")
 
-mismatch_page_active = False
-vp5100_applied = False
-
 try:
     while True:
-        now = time.time()
+        now = time.monotonic()
 
-        if now - last_mode_check > MODE_CHECK_INTERVAL:
-            ensure_std_mode()
-            last_mode_check = now
+        if not poll_pam(now):
+            idle_until_due(now)
+            continue
 
-        func = extract_number(pam_cmd("FUNCTION"))
+        func = config_cache.get("FUNCTION")
         if func is None:
             time.sleep(0.1)
             continue
 
-        func = int(func)
+        # Operator input, then one step of the page-28 workflow
+        pump_dwin()
+        check_ain_modes(func, now)
+
+        ia = pam_values.get("IA")
+        ib = pam_values.get("IB")
 
         # ================= FUNCTION 196 =================
         if func == 196:
-            mode_a = extract_mode(pam_cmd("AINA"))
-            mode_b = extract_mode(pam_cmd("AINB"))
-
-            # 🔥 MODE MISMATCH HANDLING
-            if mode_a and mode_b and mode_a != mode_b:
-                if not mismatch_page_active:
-                    switch_page(28)
-                    mismatch_page_active = True
-                    vp5100_applied = False
-
-                if not vp5100_applied:
-                    sel = read_vp_5100_polling()
-                    if sel == 0:
-                        pam_cmd("AINA V")
-                        pam_cmd("AINB V")
-                        vp5100_applied = True
-                    elif sel == 1:
-                        pam_cmd("AINA C")
-                        pam_cmd("AINB C")
-                        vp5100_applied = True
-                time.sleep(0.1)
-                continue
-            else:
-                mismatch_page_active = False
+            mode_a = config_cache.get("AINA")
 
             if mode_a:
                 send_mode_to_dwin(mode_a)
 
-            wa = extract_number(pam_cmd("WA"))
-            wb = extract_number(pam_cmd("WB"))
+            wa = pam_values.get("WA")
+            wb = pam_values.get("WB")
 
             if wa is not None:
-                send_to_dwin(0x5500, scale_value(wa, mode_a, 196))
+                send_to_dwin(VP["WA"], scale_value(wa, "AINA"))
             if wb is not None:
-                send_to_dwin(0x5600, scale_value(wb, mode_b, 196))
+                send_to_dwin(VP["WB"], scale_value(wb, "AINB"))
 
         # ================= FUNCTION 195 =================
         elif func == 195:
-            mode_a = extract_mode(pam_cmd("AINA"))
+            mode_a = config_cache.get("AINA")
             if mode_a:
                 send_mode_to_dwin(mode_a)
 
-            w = extract_number(pam_cmd("W"))
+            w = pam_values.get("W")
             if w is not None:
-                send_to_dwin(0x5500, scale_value(w, mode_a, 195))
+                send_to_dwin(VP["WA"], scale_value(w, "AINA"))
 
-            send_to_dwin(0x5600, 0.0)
+            send_to_dwin(VP["WB"], 0.0)
 
         # ================= COMMON =================
-        ia = extract_number(pam_cmd("IA"))
-        ib = extract_number(pam_cmd("IB"))
-
         if ia is not None:
-            send_to_dwin(0x5700, ia / 10.0)
+            send_to_dwin(VP["IA"], ia / 10.0)
         if ib is not None:
-            send_to_dwin(0x5800, ib / 10.0)
+            send_to_dwin(VP["IB"], ib / 10.0)
 
-        send_to_dwin(0x5900, 24.0)
-        time.sleep(MAIN_LOOP_DELAY)
+        send_to_dwin(VP["SUPPLY"], 24.0)
+        flush_dwin()
 
 except KeyboardInterrupt:
     print("\n--- SYSTEM STOPPED ---")
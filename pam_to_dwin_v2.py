@@ -2,11 +2,30 @@
 import dbus
 import dbus.mainloop.glib
 import dbus.service
+import asyncio
+import os
+import socket
+import struct
 import time
 import threading
+from collections import deque
 from gi.repository import GLib
 import serial
 
+import async_engine
+import ble_commands
+import ble_telemetry
+from dwin_link import (DWIN_AUTO_UPLOAD, DWIN_CRC, DWIN_READ_INTERVAL,
+                       PAGE_MISMATCH, VP, VP_SELECT, DwinWriter)
+from dwin_protocol import VP_PIC_NOW, FrameBuilder, FrameDecoder
+from history import HistoryRing, packets as history_packets
+from mode_mismatch import MismatchWorkflow
+from pam_cache import RegisterCache
+from pam_link import PamLink
+from pam_scheduler import PollScheduler, registers_for
+from rate_limit import OutputLimiter
+from state_snapshot import StateSnapshot
+
 BLUEZ_SERVICE_NAME = "org.bluez"
 DBUS_OM_IFACE = "org.freedesktop.DBus.ObjectManager"
 GATT_MANAGER_IFACE = "org.bluez.GattManager1"
@@ -15,10 +34,22 @@ GATT_SERVICE_IFACE = "org.bluez.GattService1"
 GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
 LE_ADVERTISEMENT_IFACE = "org.bluez.LEAdvertisement1"
 PROP_IFACE = "org.freedesktop.DBus.Properties"
+NO_INVALIDATED = dbus.Array([], signature="s")
 
 # Your custom UUIDs (keep them fixed forever)
 SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
 CHAR_UUID = "12345678-1234-5678-1234-56789abcdef1"
+# Same data as fixed-layout binary records (ble_telemetry.py)
+BIN_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef2"
+# IA/IB at the acquisition rate, batched per notification
+STREAM_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef3"
+# Split text telemetry: currents/setpoints, and status notified on change
+FAST_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef4"
+STATUS_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef5"
+# Past samples on request, in compressed blocks (history.py)
+HISTORY_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef6"
+# Settings from the app, acked with the PAM reply (ble_commands.py)
+COMMAND_CHAR_UUID = "12345678-1234-5678-1234-56789abcdef7"
 
 MAIN_LOOP = None
 
@@ -26,50 +57,102 @@ MAIN_LOOP = None
 # -------------------------------------------------
 # CONFIGURATION
 # -------------------------------------------------
-PAM_PORT = "/dev/ttyUSB0"
-DWIN_PORT = "/dev/serial0"
+PAM_PORT = os.environ.get("PAM_PORT", "/dev/ttyUSB0")
+DWIN_PORT = os.environ.get("DWIN_PORT", "/dev/serial0")
 
 
 PAM_BAUD = 57600
 DWIN_BAUD = 115200
 
-PAM_CMD_DELAY = 0.06
+PAM_CMD_TIMEOUT = 0.15
 MAIN_LOOP_DELAY = 0.03
-MODE_CHECK_INTERVAL = 3.0
+DWIN_RETRY = 1.0
+
+# "loop": blocking main loop, "asyncio": event-driven engine
+PVC_ENGINES = ("loop", "asyncio")
+PVC_ENGINE = os.environ.get("PVC_ENGINE", "loop")
+if PVC_ENGINE not in PVC_ENGINES:
+    raise SystemExit(f"PVC_ENGINE must be one of {', '.join(PVC_ENGINES)}, "
+                     f"not {PVC_ENGINE!r}")
+
+# "system" for BlueZ, or the address of a stand-in bus (ble_standin.py)
+BLE_BUS = os.environ.get("BLE_BUS", "system")
+
+# BLE notifications follow each new sample, but at most BLE_MAX_RATE per
+# second (0 = every sample, like DWIN_MAX_RATE) and only when a value
+# moved by more than its deadband (WA/WB in V or mA, IA/IB raw)
+BLE_MAX_RATE = float(os.environ.get("BLE_MAX_RATE", "20"))
+BLE_DEADBANDS = {"WA": 0.01, "WB": 0.01, "IA": 1, "IB": 1}
+# A stream batch waits at most this long to fill up
+BLE_BATCH_LATENCY = 0.1
+# Delta mode on the binary characteristic: full packet this often
+BLE_KEYFRAME_INTERVAL = 5.0
+BLE_STATUS_MIN_INTERVAL = 0.5
+# Backfill pacing, so live notifications keep most of the link
+BLE_BACKFILL_INTERVAL_MS = 20
+BLE_BACKFILL_BURST = 4
+# ATT MTU assumed until the central's reads, writes or AcquireNotify say
+# otherwise (23 is the minimum every central supports)
+BLE_DEFAULT_MTU = int(os.environ.get("BLE_DEFAULT_MTU",
+                                     ble_telemetry.DEFAULT_MTU))
+
+# Samples kept for backfill, 16 bytes each
+PVC_HISTORY_SAMPLES = int(os.environ.get("PVC_HISTORY_SAMPLES", "1000000"))
 
 # -------------------------------------------------
 # SERIAL OBJECTS
 # -------------------------------------------------
 pam = None
 dwin = None
+dwin_retry_at = 0.0
+dwin_reader = None
 
 pam_connected_once = False
-last_mode_check = 0
-
-machine_state = {
-    "FUNC": None,
-    "WA": None,
-    "WB": None,
-    "IA": None,
-    "IB": None,
-    "MODE": None
-}
 
-state_lock = threading.Lock()
+scheduler = PollScheduler()
+pam_values = {}
+config_cache = RegisterCache()
+
+# Set commands sent ahead of the next register batch
+pam_writes = deque()
+# Commands from the app (CommandJob); they go out before anything else
+ble_jobs = deque()
+# Set when ble_jobs gets work, to cut the idle wait short
+pam_wakeup = threading.Event()
+async_wakeup = None
+async_loop = None
+
+# Latest values the operator entered on the DWIN, by VP
+dwin_inputs = {}
+
+# Latest committed sample; replaced as a whole, never modified in place
+machine_state = StateSnapshot.empty()
+history = HistoryRing(PVC_HISTORY_SAMPLES)
+
+# Characteristics fed by publish(), once the GATT app is registered
+ble_chars = []
+ble_flush_pending = False
+ble_samples = ble_telemetry.SampleBatcher(BLE_BATCH_LATENCY)
 
 # -------------------------------------------------
 # SERIAL INIT / RECONNECT
 # -------------------------------------------------
 
 
-def open_pam():
+def connect_pam():
     global pam, pam_connected_once
+    pam = PamLink(serial.Serial(PAM_PORT, PAM_BAUD,
+                                timeout=0.15, write_timeout=0.15),
+                  timeout=PAM_CMD_TIMEOUT)
+    pam_connected_once = False
+    config_cache.invalidate()
+
+
+def open_pam():
     while True:
         try:
-            pam = serial.Serial(PAM_PORT, PAM_BAUD,
-                                timeout=0.15, write_timeout=0.15)
+            connect_pam()
             time.sleep(0.5)
-            pam_connected_once = False
             print("✅ PAM connected")
             return
         except Exception:
@@ -89,6 +172,31 @@ def open_dwin():
             time.sleep(1)
 
 
+def reopen_dwin():
+    """One reconnect attempt, at most every DWIN_RETRY seconds."""
+    global dwin, dwin_retry_at
+    now = time.monotonic()
+    if now < dwin_retry_at:
+        return
+    dwin_retry_at = now + DWIN_RETRY
+    try:
+        dwin.close()
+    except Exception:
+        pass
+    try:
+        dwin = serial.Serial(DWIN_PORT, DWIN_BAUD, timeout=0.2)
+    except Exception:
+        return
+    print("✅ DWIN reconnected")
+    dwin_rx.reset()
+    # The display may have rebooted: send it everything again
+    dwin_writer.resync()
+    if dwin_reader is not None:
+        dwin_reader.stop()
+        dwin_reader.port = dwin
+        dwin_reader.start()
+
+
 def reopen_pam():
     global pam
     try:
@@ -107,17 +215,34 @@ open_dwin()
 # -------------------------------------------------
 
 
-def pam_cmd(cmd):
+def pam_query(cmds):
+    """PamResponse per command, or None if the port failed."""
     global pam
+    for cmd in cmds:
+        config_cache.written(cmd)
     try:
-        pam.reset_input_buffer()
-        pam.write((cmd + "\r\n").encode())
-        time.sleep(PAM_CMD_DELAY)
-        return pam.read(pam.in_waiting or 1).decode(errors="ignore")
+        return pam.query_many(cmds)
     except Exception as e:
         print("❌ PAM ERROR:", e)
         reopen_pam()
-        return ""
+        return None
+
+
+def pam_cmds(cmds):
+    replies = pam_query(cmds)
+    if replies is None:
+        return [""] * len(cmds)
+    return reply_texts(replies)
+
+
+def reply_texts(replies):
+    texts = []
+    for resp in replies:
+        if not resp.ok:
+            print(f"⚠ PAM {resp.status} reply to {resp.cmd} "
+                  f"after {resp.rtt * 1000:.0f} ms")
+        texts.append(resp.text if resp.ok else "")
+    return texts
 
 
 def extract_number(resp):
@@ -129,6 +254,11 @@ def extract_number(resp):
     return None
 
 
+def extract_function(resp):
+    func = extract_number(resp)
+    return int(func) if func is not None else None
+
+
 def extract_mode(resp):
     if "V" in resp:
         return "V"
@@ -149,17 +279,14 @@ def extract_pam_mode(resp):
 # -------------------------------------------------
 
 
-def ensure_std_mode():
+def ensure_std_mode(mode):
     global pam_connected_once
-    resp = pam_cmd("MODE")
-    mode = extract_pam_mode(resp)
-
     if mode == "EXP":
-        pam_cmd("MODE STD")
-        time.sleep(0.1)
-        pam_cmd("MODE")
+        # The write drops MODE from the cache, so it is verified next cycle
+        pam_writes.append("MODE STD")
+        return
 
-    if not pam_connected_once:
+    if mode == "STD" and not pam_connected_once:
         print("✔ PAM MODE verified as STD")
         pam_connected_once = True
 
@@ -167,82 +294,142 @@ def ensure_std_mode():
 # -------------------------------------------------
 # DWIN FUNCTIONS
 # -------------------------------------------------
-cache = {}
+dwin_writer = DwinWriter()
+# One-off frames (page switch, VP reads) reuse this buffer
+dwin_frames = FrameBuilder(crc=DWIN_CRC)
 
 
 def send_to_dwin(vpin, value):
-    try:
-        iv = int(round(value * 10))
-        iv = max(-32768, min(32767, iv))
+    if value is None:
+        # Not scalable yet, e.g. AINA/AINB still being re-read
+        return
+    iv = int(round(value * 10))
+    iv = max(-32768, min(32767, iv))
+    dwin_writer.set(vpin, iv)
 
-        if cache.get(vpin) == iv:
-            return
 
-        cache[vpin] = iv
-        packet = (
-            bytes([0x5A, 0xA5, 0x05, 0x82]) +
-            vpin.to_bytes(2, "big") +
-            iv.to_bytes(2, "big", signed=True)
-        )
-        dwin.write(packet)
+def send_mode_to_dwin(mode):
+    mode_val = 0 if mode == "V" else 1
+    dwin_writer.set(VP["MODE"], mode_val)
+
+
+def flush_dwin():
+    # One write() per cycle, adjacent VPs merged into one frame
+    try:
+        dwin_writer.flush(dwin)
     except Exception as e:
         print("❌ DWIN ERR:", e)
+        reopen_dwin()
 
 
-def send_mode_to_dwin(mode):
+def send_dwin_frames():
     try:
-        mode_val = 0 if mode == "V" else 1
-        with state_lock:
-            packet = bytes([0x5A, 0xA5, 0x05, 0x82, 0x50, 0x00]) + \
-                mode_val.to_bytes(2, "big")
-        dwin.write(packet)
-    except Exception:
-        pass
+        dwin.write(dwin_frames.frames())
+    except Exception as e:
+        print("❌ DWIN ERR:", e)
+        reopen_dwin()
 
 
 def switch_page(page_id):
-    frame = bytes([
-        0x5A, 0xA5, 0x07, 0x82,
-        0x00, 0x84, 0x5A, 0x01,
-        (page_id >> 8) & 0xFF,
-        page_id & 0xFF
-    ])
-    dwin.write(frame)
-    dwin.flush()
-    time.sleep(0.05)
-    dwin.reset_input_buffer()
+    dwin_frames.reset()
+    dwin_frames.page_switch(page_id)
+    send_dwin_frames()
+    # New page: make sure it shows every current value
+    dwin_writer.resync()
     print(f"📄 Switched to page {page_id}")
 
 # -------------------------------------------------
-# VP5100 POLLING
+# DWIN INPUT
 # -------------------------------------------------
 
 
-def read_vp_5100_polling(timeout=2.0):
-    start = time.time()
-    buffer = b""
-    cmd = bytes([0x5A, 0xA5, 0x03, 0x83, 0x51, 0x00])
+def on_dwin_input(vp, words):
+    # Read replies and auto-uploaded touch input alike
+    dwin_inputs[vp] = words[0] if words else None
 
-    dwin.reset_input_buffer()
 
-    while time.time() - start < timeout:
-        dwin.write(cmd)
-        t0 = time.time()
-        while time.time() - t0 < 0.15:
-            if dwin.in_waiting:
-                buffer += dwin.read(dwin.in_waiting)
-                if len(buffer) >= 8:
-                    return (buffer[-2] << 8) | buffer[-1]
-            time.sleep(0.01)
-    return None
+dwin_rx = FrameDecoder(crc=DWIN_CRC, default=on_dwin_input)
+
+
+def pump_dwin():
+    """Feed whatever the display has sent so far to dwin_rx."""
+    try:
+        waiting = dwin.in_waiting
+        if waiting:
+            dwin_rx.feed(dwin.read(waiting))
+    except Exception as e:
+        print("❌ DWIN ERR:", e)
+
+
+# -------------------------------------------------
+# MODE MISMATCH (PAGE 28)
+# -------------------------------------------------
+
+
+def show_mismatch_page(retry=False):
+    dwin_inputs.pop(VP_SELECT, None)
+    dwin_frames.reset()
+    if not retry:
+        # Remember the page shown now; on a retry that is page 28 itself
+        dwin_inputs.pop(VP_PIC_NOW, None)
+        dwin_frames.read_request(VP_PIC_NOW)
+    # Clear any old selection first
+    dwin_frames.write_words(VP_SELECT, (0xFFFF,))
+    dwin_frames.page_switch(PAGE_MISMATCH)
+    send_dwin_frames()
+    dwin_writer.resync()
+    print(f"📄 Switched to page {PAGE_MISMATCH}")
+
+
+def request_selection():
+    dwin_frames.reset()
+    dwin_frames.read_request(VP_SELECT)
+    send_dwin_frames()
+
+
+def apply_ain_mode(mode):
+    # Sent ahead of the next register batch
+    pam_writes.extend((f"AINA {mode}", f"AINB {mode}"))
+
+
+def reread_ain_modes():
+    config_cache.invalidate("AINA", "AINB")
+
+
+def restore_page():
+    page = dwin_inputs.pop(VP_PIC_NOW, None)
+    if page is None or page == PAGE_MISMATCH:
+        print("⚠ Previous DWIN page unknown, staying on mismatch page")
+        return
+    switch_page(page)
+
+
+mismatch = MismatchWorkflow(show_mismatch_page, request_selection,
+                            apply_ain_mode, reread_ain_modes, restore_page,
+                            poll_interval=DWIN_READ_INTERVAL,
+                            auto_upload=DWIN_AUTO_UPLOAD)
+
+
+def check_ain_modes(func, now):
+    """One step of the page-28 workflow; never blocks."""
+    if func != 196:
+        mismatch.cancel()
+        return
+    selection = dwin_inputs.pop(VP_SELECT, None) if mismatch.active else None
+    mismatch.step(now, config_cache.get("AINA"), config_cache.get("AINB"),
+                  selection)
 
 # -------------------------------------------------
 # SCALING
 # -------------------------------------------------
 
 
-def scale_value(raw, mode, function):
+def scale_value(raw, ain):
+    if raw is None:
+        return None
     raw = float(raw)
+    mode = config_cache.get(ain)
+    function = config_cache.get("FUNCTION")
     if mode == "V":
         return raw / 1000.0
     if mode == "C":
@@ -251,11 +438,135 @@ def scale_value(raw, mode, function):
         return min(20.0, max(4.0, (raw * 0.0008) + 12.0))
     return None
 
+# -------------------------------------------------
+# REGISTER POLLING
+# -------------------------------------------------
+
+
+PAM_PARSERS = {
+    "FUNCTION": extract_function,
+    "MODE": extract_pam_mode,
+    "AINA": extract_mode,
+    "AINB": extract_mode,
+    "WA": extract_number,
+    "WB": extract_number,
+    "W": extract_number,
+    "IA": extract_number,
+    "IB": extract_number,
+}
+
+
+def due_registers(now):
+    active = registers_for(config_cache.get("FUNCTION"))
+    names = scheduler.due(now, active)
+    names += [n for n in config_cache.missing(active) if n not in names]
+    return names
+
+
+def take_pam_writes():
+    writes = list(pam_writes)
+    pam_writes.clear()
+    return writes
+
+
+def submit_ble_command(data):
+    """Called on the GLib loop for every command write. A rejected
+    command fails the write, so the central gets an ATT error."""
+    try:
+        text, cmds = ble_commands.parse(data, config_cache.get("FUNCTION"))
+    except ValueError as e:
+        print(f"⚠ BLE command {bytes(data)!r} rejected: {e}")
+        send_ble_ack(ble_commands.encode_reject(data, str(e)))
+        raise dbus.exceptions.DBusException(
+            str(e), name="org.bluez.Error.Failed")
+    print(f"📲 BLE command {text}")
+    ble_jobs.append(ble_commands.CommandJob(text, cmds, send_ble_ack))
+    pam_wakeup.set()
+    if async_loop is not None:
+        async_loop.call_soon_threadsafe(async_wakeup.set)
+
+
+def take_ble_jobs():
+    jobs = []
+    while ble_jobs:
+        jobs.append(ble_jobs.popleft())
+    return jobs
+
+
+def finish_ble_jobs(jobs, replies, started):
+    # One ack per job, each with the replies to its own commands
+    offset = 0
+    for job in jobs:
+        n = len(job.cmds)
+        mine = None if replies is None else replies[offset:offset + n]
+        offset += n
+        if mine is not None:
+            reply_texts(mine)
+        job.reply(ble_commands.encode_ack(job, mine, started))
+
+
+def run_ble_jobs():
+    """App commands go out in a batch of their own, ahead of the poll."""
+    jobs = take_ble_jobs()
+    if jobs:
+        started = time.monotonic()
+        replies = pam_query([c for job in jobs for c in job.cmds])
+        finish_ble_jobs(jobs, replies, started)
+
+
+def poll_pam(now):
+    run_ble_jobs()
+    writes = take_pam_writes()
+    names = due_registers(now)
+    if not names and not writes:
+        return []
+
+    replies = pam_cmds(writes + names)
+    apply_replies(names, replies[len(writes):], now)
+    return names
+
+
+def apply_replies(names, replies, now):
+    for name, resp in zip(names, replies):
+        value = PAM_PARSERS[name](resp)
+        scheduler.update(name, value, now)
+        if value is None:
+            continue
+        if name not in config_cache:
+            pam_values[name] = value
+        elif config_cache.store(name, value):
+            print(f"🔧 PAM {name} changed to {value}")
+            if name == "FUNCTION":
+                config_cache.invalidate("AINA", "AINB")
+
+    if "MODE" in names:
+        ensure_std_mode(config_cache.get("MODE"))
+
+    if ble_chars and ("IA" in names or "IB" in names):
+        ble_samples.add(now, pam_values.get("IA"), pam_values.get("IB"))
+
+
+def idle_time(now):
+    active = registers_for(config_cache.get("FUNCTION"))
+    wait = scheduler.next_due(active) - now
+    return min(MAIN_LOOP_DELAY, max(0.0, wait))
+
+
+def idle_until_due(now):
+    if pam_wakeup.wait(idle_time(now)):
+        pam_wakeup.clear()
+
 # -------------------------------------------------
 # BLUEZ HELPERS
 # -------------------------------------------------
 
 
+def open_ble_bus():
+    if BLE_BUS == "system":
+        return dbus.SystemBus()
+    return dbus.bus.BusConnection(BLE_BUS)
+
+
 def find_adapter(bus):
     om = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, "/"), DBUS_OM_IFACE)
     objects = om.GetManagedObjects()
@@ -294,6 +605,12 @@ class Service(dbus.service.Object):
         self.uuid = uuid
         self.primary = primary
         self.characteristics = []
+        self.props = {
+            GATT_SERVICE_IFACE: {
+                "UUID": self.uuid,
+                "Primary": self.primary,
+            }
+        }
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_path(self):
@@ -303,15 +620,14 @@ class Service(dbus.service.Object):
         self.characteristics.append(chrc)
 
     def get_properties(self):
-        return {
-            GATT_SERVICE_IFACE: {
-                "UUID": self.uuid,
-                "Primary": self.primary,
-            }
-        }
+        return self.props
 
 
 class Characteristic(dbus.service.Object):
+    # Offer AcquireNotify: BlueZ then passes the MTU when the central
+    # subscribes, and notifications go through a socket instead of D-Bus
+    acquire = False
+
     def __init__(self, bus, index, uuid, flags, service):
         self.path = service.path + f"/char{index}"
         self.bus = bus
@@ -319,26 +635,47 @@ class Characteristic(dbus.service.Object):
         self.flags = flags
         self.service = service
         self.notifying = False
-        self.value = [dbus.Byte(0)]
+        self.notify_sock = None
+        self.value = b"\x00"
+        # Raised by BlueZ once the central negotiated a bigger ATT MTU
+        self.mtu = BLE_DEFAULT_MTU
+        # Never change after registration: built once, not per Get/GetAll
+        self.props = {
+            GATT_CHRC_IFACE: {
+                "Service": service.get_path(),
+                "UUID": uuid,
+                "Flags": dbus.Array(flags, signature="s"),
+            }
+        }
+        if self.acquire:
+            self.props[GATT_CHRC_IFACE]["NotifyAcquired"] = False
+        # Reused for every PropertiesChanged
+        self.changed = dbus.Dictionary({}, signature="sv")
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_path(self):
         return dbus.ObjectPath(self.path)
 
     def get_properties(self):
-        return {
-            GATT_CHRC_IFACE: {
-                "Service": self.service.get_path(),
-                "UUID": self.uuid,
-                "Flags": self.flags,
-            }
-        }
+        return self.props
 
-    def _notify_value(self, text: str):
+    def _notify_value(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.value = data
         if not self.notifying:
             return
-        data = [dbus.Byte(b) for b in text.encode("utf-8")]
-        self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": data}, [])
+        if self.notify_sock is not None:
+            try:
+                self.notify_sock.send(data)
+            except BlockingIOError:
+                pass            # socket full: drop it, like BlueZ would
+            except OSError:
+                self._release()
+            return
+        # The payload goes out as one "ay", not a dbus.Byte per byte
+        self.changed["Value"] = dbus.ByteArray(data)
+        self.PropertiesChanged(GATT_CHRC_IFACE, self.changed, NO_INVALIDATED)
 
     @dbus.service.method(PROP_IFACE, in_signature="ss", out_signature="v")
     def Get(self, interface, prop):
@@ -363,49 +700,270 @@ class Characteristic(dbus.service.Object):
 
     @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
     def ReadValue(self, options):
+        self._note_mtu(options)
         # return last value (optional)
-        return dbus.Array(self.value, signature="y")
+        return dbus.ByteArray(self.value)
 
-    @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}",
+                         byte_arrays=True)
     def WriteValue(self, value, options):
-        # not needed here
+        self._note_mtu(options)
+        self.on_write(bytes(value))
+
+    def on_write(self, data):
         pass
 
+    def _note_mtu(self, options):
+        # StartNotify carries no options; everything else tells the MTU
+        if "mtu" in options:
+            self.mtu = int(options["mtu"])
+
     @dbus.service.method(GATT_CHRC_IFACE)
     def StartNotify(self):
         self.notifying = True
+        self.on_subscribe()
+
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}",
+                         out_signature="hq")
+    def AcquireNotify(self, options):
+        if not self.acquire:
+            raise dbus.exceptions.DBusException(
+                "Not supported", name="org.bluez.Error.NotSupported")
+        if self.notify_sock is not None:
+            raise dbus.exceptions.DBusException(
+                "Already acquired", name="org.bluez.Error.NotPermitted")
+        self._note_mtu(options)
+        ours, theirs = socket.socketpair(socket.AF_UNIX,
+                                         socket.SOCK_SEQPACKET)
+        ours.setblocking(False)
+        fd = dbus.types.UnixFd(theirs)      # dups it
+        theirs.close()
+        self.notify_sock = ours
+        # BlueZ closes its end when the central unsubscribes
+        GLib.io_add_watch(ours.fileno(), GLib.PRIORITY_DEFAULT,
+                          GLib.IO_HUP | GLib.IO_ERR, self._on_hangup)
+        self.notifying = True
+        self.on_subscribe()
+        return fd, dbus.UInt16(self.mtu)
+
+    def _on_hangup(self, fd, condition):
+        self._release()
+        return False
+
+    def _release(self):
+        if self.notify_sock is not None:
+            self.notify_sock.close()
+            self.notify_sock = None
+        self.notifying = False
+
+    def on_subscribe(self):
+        pass
 
     @dbus.service.method(GATT_CHRC_IFACE)
     def StopNotify(self):
-        self.notifying = False
+        self._release()
+
+
+class CommandCharacteristic(Characteristic):
+    """The app writes a setting here and gets an ack notification."""
+
+    def __init__(self, bus, index, service):
+        super().__init__(bus, index, COMMAND_CHAR_UUID,
+                         ["write", "write-without-response", "notify"],
+                         service)
+
+    def on_write(self, data):
+        submit_ble_command(data)
+
+    def ack(self, data):
+        self._notify_value(data)
+        return False
+
+
+# Set once the GATT app exists
+ble_command_ch = None
+
+
+def send_ble_ack(data):
+    """Thread-safe: the ack is notified from the GLib loop."""
+    if ble_command_ch is not None:
+        GLib.idle_add(ble_command_ch.ack, data)
 
 
 class DataCharacteristic(Characteristic):
+    """Text telemetry, kept for apps that predate the binary format."""
+
+    # Fields that trigger a notification (None: all of them)
+    fields = None
+
+    def __init__(self, bus, index, service, uuid=CHAR_UUID,
+                 flags=("read", "notify")):
+        super().__init__(bus, index, uuid, list(flags), service)
+        self.out = OutputLimiter(1.0 / BLE_MAX_RATE if BLE_MAX_RATE else 0.0,
+                                 BLE_DEADBANDS)
+
+    def encode(self, state):
+        return ble_telemetry.encode_text(state)
+
+    def on_write(self, data):
+        # The app's config screens write their commands here
+        submit_ble_command(data)
+
+    def on_subscribe(self):
+        # New subscriber: send the full state right away
+        self.out.force()
+        notify_ble()
+
+    def publish(self, state, now):
+        """Notify state if the rate limit allows; else seconds to wait."""
+        if self.fields is None:
+            self.out.offer(state)
+        else:
+            self.out.offer({name: state[name] for name in self.fields})
+        if self.out.take(now) is None:
+            return self.out.wait_time(now)
+        data = self.encode(state)
+        self._notify_value(data)
+        return None
+
+
+class BinaryDataCharacteristic(DataCharacteristic):
+    """Fixed 12-byte records, or delta packets once the app writes "D"
+    (see ble_telemetry.py)."""
+
     def __init__(self, bus, index, service):
-        super().__init__(bus, index, CHAR_UUID, ["read", "notify"], service)
+        super().__init__(bus, index, service, BIN_CHAR_UUID,
+                         ("read", "write", "notify"))
+        self.delta = None
+
+    def encode(self, state):
+        return ble_telemetry.encode_binary(state)
+
+    def on_subscribe(self):
+        if self.delta:
+            self.delta.request_keyframe()
+        super().on_subscribe()
+
+    def on_write(self, data):
+        cmd = data[:1].upper()
+        if cmd == b"D":
+            self.delta = ble_telemetry.DeltaEncoder(BLE_KEYFRAME_INTERVAL)
+        elif cmd == b"F":
+            self.delta = None
+            self.out.force()
+        elif cmd == b"K" and self.delta:
+            self.delta.request_keyframe()
+        else:
+            return
+        notify_ble()
 
-    def start_sending(self):
-        def loop():
-            while True:
-                try:
-                    packet = (
-                        f"FUNC:{machine_state['FUNC']},"
-                        f"WA:{machine_state['WA']},"
-                        f"WB:{machine_state['WB']},"
-                        f"IA:{machine_state['IA']},"
-                        f"IB:{machine_state['IB']},"
-                        f"MODE:{machine_state['MODE']}\n"
-                    )
+    def publish(self, state, now):
+        if self.delta is None:
+            return super().publish(state, now)
+        self.out.offer(state)
+        keyframe = self.delta.keyframe_due(now)
+        if self.out.take(now) is None and not keyframe:
+            return self.out.wait_time(now)
+        data = self.delta.encode(state, now)
+        if data is not None:
+            self._notify_value(data)
+        return None
 
-                    self.value = [dbus.Byte(b) for b in packet.encode("utf-8")]
-                    self._notify_value(packet)
 
-                except Exception as e:
-                    print("BLE ERROR:", e)
+class FastCharacteristic(DataCharacteristic):
+    """WA/WB/IA/IB only, at the full notify rate."""
 
-                time.sleep(0.2)
+    fields = ble_telemetry.FAST_FIELDS
+
+    def __init__(self, bus, index, service):
+        super().__init__(bus, index, service, FAST_CHAR_UUID)
+
+    def encode(self, state):
+        return ble_telemetry.encode_fast(state)
 
-        threading.Thread(target=loop, daemon=True).start()
+
+class StatusCharacteristic(DataCharacteristic):
+    """Function and modes, notified only when one of them changes."""
+
+    fields = ble_telemetry.STATUS_FIELDS
+
+    def __init__(self, bus, index, service):
+        super().__init__(bus, index, service, STATUS_CHAR_UUID)
+        self.out = OutputLimiter(BLE_STATUS_MIN_INTERVAL)
+
+    def encode(self, state):
+        return ble_telemetry.encode_status(state)
+
+
+def unwrap_ms(ms, now):
+    """Monotonic seconds for a wrapped u32 ms time from the BLE stream."""
+    now_ms = int(now * 1000)
+    return (now_ms - ((now_ms - ms) & 0xFFFFFFFF)) / 1000.0
+
+
+class HistoryCharacteristic(Characteristic):
+    """Backfill: the app writes ``R`` + u32 from_ms + u32 to_ms
+    (0xFFFFFFFF = now) and gets that range as notifications; ``X``
+    cancels."""
+
+    acquire = True
+
+    def __init__(self, bus, index, service):
+        super().__init__(bus, index, HISTORY_CHAR_UUID, ["write", "notify"],
+                         service)
+        self.transfer = None
+
+    def on_write(self, data):
+        cmd = data[:1].upper()
+        if cmd == b"X":
+            self.transfer = None
+            return
+        if cmd != b"R" or len(data) < 9:
+            print("⚠ BLE history: bad request", data.hex())
+            return
+        from_ms, to_ms = struct.unpack_from("<II", data, 1)
+        now = time.monotonic()
+        t0 = unwrap_ms(from_ms, now)
+        t1 = now if to_ms == 0xFFFFFFFF else unwrap_ms(to_ms, now)
+        running = self.transfer is not None
+        self.transfer = history_packets(history.blocks(t0, t1), self.mtu)
+        if not running:
+            GLib.timeout_add(BLE_BACKFILL_INTERVAL_MS, self._pump)
+
+    def _pump(self):
+        if self.transfer is None or not self.notifying:
+            self.transfer = None
+            return False
+        for _ in range(BLE_BACKFILL_BURST):
+            data = next(self.transfer, None)
+            if data is None:
+                self.transfer = None
+                return False
+            self._notify_value(data)
+        return True
+
+
+class StreamCharacteristic(Characteristic):
+    """IA/IB samples, as many per notification as the MTU allows."""
+
+    acquire = True
+
+    def __init__(self, bus, index, service):
+        super().__init__(bus, index, STREAM_CHAR_UUID, ["read", "notify"],
+                         service)
+
+    def on_subscribe(self):
+        ble_samples.clear()
+
+    def publish(self, state, now):
+        if not self.notifying:
+            ble_samples.clear()
+            return None
+        while True:
+            data = ble_samples.take(now, self.mtu)
+            if data is None:
+                return ble_samples.wait_time(now)
+            self._notify_value(data)
 
 
 class Advertisement(dbus.service.Object):
@@ -441,10 +999,41 @@ class Advertisement(dbus.service.Object):
         pass
 
 
+def notify_ble():
+    """Called after each committed sample, from any thread."""
+    global ble_flush_pending
+    if not ble_chars or ble_flush_pending:
+        return
+    ble_flush_pending = True
+    # D-Bus signals are emitted from the GLib main loop only
+    GLib.idle_add(flush_ble)
+
+
+def flush_ble():
+    global ble_flush_pending
+    ble_flush_pending = False
+    state = machine_state
+    now = time.monotonic()
+    wait = None
+    for ch in ble_chars:
+        try:
+            w = ch.publish(state, now)
+        except Exception as e:
+            print("BLE ERROR:", e)
+            continue
+        if w is not None:
+            wait = w if wait is None else min(wait, w)
+    if wait is not None:
+        # Rate-limited: come back when the newest state may go out
+        ble_flush_pending = True
+        GLib.timeout_add(max(1, int(wait * 1000)), flush_ble)
+    return False
+
+
 def main():
-    global MAIN_LOOP
+    global MAIN_LOOP, ble_command_ch
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
-    bus = dbus.SystemBus()
+    bus = open_ble_bus()
 
     adapter = find_adapter(bus)
     if not adapter:
@@ -454,8 +1043,21 @@ def main():
     # Build GATT app
     app = Application(bus)
     service = Service(bus, 0, SERVICE_UUID, True)
-    ch = DataCharacteristic(bus, 0, service)
+    ch = DataCharacteristic(bus, 0, service,
+                            flags=("read", "write", "notify"))
+    bin_ch = BinaryDataCharacteristic(bus, 1, service)
+    stream_ch = StreamCharacteristic(bus, 2, service)
+    fast_ch = FastCharacteristic(bus, 3, service)
+    status_ch = StatusCharacteristic(bus, 4, service)
+    history_ch = HistoryCharacteristic(bus, 5, service)
+    ble_command_ch = CommandCharacteristic(bus, 6, service)
     service.add_characteristic(ch)
+    service.add_characteristic(bin_ch)
+    service.add_characteristic(stream_ch)
+    service.add_characteristic(fast_ch)
+    service.add_characteristic(status_ch)
+    service.add_characteristic(history_ch)
+    service.add_characteristic(ble_command_ch)
     app.add_service(service)
 
     # Register GATT app
@@ -470,7 +1072,8 @@ def main():
 
     def on_app_registered():
         print("GATT application registered")
-        ch.start_sending()
+        ble_chars.extend((ch, bin_ch, stream_ch, fast_ch, status_ch))
+        notify_ble()
 
     def on_app_error(e):
         print("Failed to register application:", e)
@@ -502,103 +1105,210 @@ def start_ble():
 
 
 # -------------------------------------------------
-# MAIN LOOP
+# OUTPUTS
 # -------------------------------------------------
 
 
-mismatch_page_active = False
-vp5100_applied = False
+def publish(func):
+    global machine_state
+    mode_a = config_cache.get("AINA")
+    wa = wb = None
 
-if __name__ == "__main__":
-    print("\n--- SYSTEM RUNNING ---")
+    ia = pam_values.get("IA")
+    ib = pam_values.get("IB")
 
-    # Start BLE in background
-    threading.Thread(target=start_ble, daemon=True).start()
+    # ================= FUNCTION 196 =================
+    if func == 196:
+
+        wa = scale_value(pam_values.get("WA"), "AINA")
+        wb = scale_value(pam_values.get("WB"), "AINB")
 
+        # -------- DWIN OUTPUT ----------
+        if mode_a:
+            send_mode_to_dwin(mode_a)
+
+        if wa is not None:
+            send_to_dwin(VP["WA"], wa)
+
+        if wb is not None:
+            send_to_dwin(VP["WB"], wb)
+
+        if ia is not None:
+            send_to_dwin(VP["IA"], ia / 10.0)
+
+        if ib is not None:
+            send_to_dwin(VP["IB"], ib / 10.0)
+
+        send_to_dwin(VP["SUPPLY"], 24.0)
+
+    # ================= FUNCTION 195 =================
+    elif func == 195:
+
+        wa = scale_value(pam_values.get("W"), "AINA")
+        wb = 0.0
+
+        # -------- DWIN OUTPUT ----------
+        if mode_a:
+            send_mode_to_dwin(mode_a)
+
+        if wa is not None:
+            send_to_dwin(VP["WA"], wa)
+
+        send_to_dwin(VP["WB"], wb)
+
+        if ia is not None:
+            send_to_dwin(VP["IA"], ia / 10.0)
+
+        if ib is not None:
+            send_to_dwin(VP["IB"], ib / 10.0)
+
+        send_to_dwin(VP["SUPPLY"], 24.0)
+
+    flush_dwin()
+
+    # ================= SAVE FOR BLE =================
+    machine_state = machine_state.next(
+        time.monotonic(), FUNC=func, WA=wa, WB=wb, IA=ia, IB=ib,
+        MODE=mode_a, MODE_B=config_cache.get("AINB"),
+        PAM_MODE=config_cache.get("MODE"))
+    history.append(machine_state.t, wa, wb, ia, ib)
+
+    notify_ble()
+
+
+# -------------------------------------------------
+# ASYNCIO ENGINE
+# -------------------------------------------------
+
+
+async def pam_query_async(cmds):
+    for cmd in cmds:
+        config_cache.written(cmd)
     try:
-        while True:
+        return await async_engine.query_many(pam, cmds)
+    except Exception as e:
+        print("❌ PAM ERROR:", e)
+        await reopen_pam_async()
+        return None
+
 
-            now = time.time()
+async def pam_cmds_async(cmds):
+    replies = await pam_query_async(cmds)
+    if replies is None:
+        return [""] * len(cmds)
+    return reply_texts(replies)
 
-            if now - last_mode_check > MODE_CHECK_INTERVAL:
-                ensure_std_mode()
-                last_mode_check = now
 
-            func = extract_number(pam_cmd("FUNCTION"))
-            if func is None:
-                time.sleep(0.1)
-                continue
+async def run_ble_jobs_async():
+    jobs = take_ble_jobs()
+    if jobs:
+        started = time.monotonic()
+        replies = await pam_query_async([c for job in jobs for c in job.cmds])
+        finish_ble_jobs(jobs, replies, started)
 
-            func = int(func)
 
-            # ================= FUNCTION 196 =================
-            if func == 196:
+async def idle_async(now):
+    async_wakeup.clear()
+    if ble_jobs:
+        return
+    try:
+        await asyncio.wait_for(async_wakeup.wait(), idle_time(now))
+    except asyncio.TimeoutError:
+        pass
+
+
+async def reopen_pam_async():
+    try:
+        pam.close()
+    except Exception:
+        pass
+    while True:
+        try:
+            connect_pam()
+            await asyncio.sleep(0.5)
+            print("✅ PAM connected")
+            return
+        except Exception:
+            print("⏳ Waiting for PAM...")
+            await asyncio.sleep(1)
 
-                mode_a = extract_mode(pam_cmd("AINA"))
-                mode_b = extract_mode(pam_cmd("AINB"))
 
-                wa = extract_number(pam_cmd("WA"))
-                wb = extract_number(pam_cmd("WB"))
+async def acquisition_task():
+    while True:
+        await run_ble_jobs_async()
+        now = time.monotonic()
+        writes = take_pam_writes()
+        names = due_registers(now)
+        if not names and not writes:
+            await idle_async(now)
+            continue
 
-                ia = extract_number(pam_cmd("IA"))
-                ib = extract_number(pam_cmd("IB"))
+        replies = await pam_cmds_async(writes + names)
+        apply_replies(names, replies[len(writes):], now)
 
-                # -------- DWIN OUTPUT ----------
-                if mode_a:
-                    send_mode_to_dwin(mode_a)
+        func = config_cache.get("FUNCTION")
+        if func is None:
+            await asyncio.sleep(0.1)
+            continue
+        check_ain_modes(func, now)
+        publish(func)
 
-                if wa is not None:
-                    send_to_dwin(0x5500, scale_value(wa, mode_a, 196))
 
-                if wb is not None:
-                    send_to_dwin(0x5600, scale_value(wb, mode_b, 196))
+def on_dwin_data(data):
+    dwin_rx.feed(data)
 
-                if ia is not None:
-                    send_to_dwin(0x5700, ia / 10.0)
 
-                if ib is not None:
-                    send_to_dwin(0x5800, ib / 10.0)
+def on_dwin_error(e):
+    print("❌ DWIN ERR:", e)
+    reopen_dwin()
 
-                send_to_dwin(0x5900, 24.0)
 
-            # ================= FUNCTION 195 =================
-            elif func == 195:
+async def run_async_engine():
+    global dwin_reader, async_loop, async_wakeup
+    async_wakeup = asyncio.Event()
+    async_loop = asyncio.get_running_loop()
+    dwin_reader = async_engine.PortReader(dwin, on_dwin_data, on_dwin_error)
+    dwin_reader.start()
+    try:
+        await acquisition_task()
+    finally:
+        dwin_reader.stop()
 
-                mode_a = extract_mode(pam_cmd("AINA"))
 
-                wa = extract_number(pam_cmd("W"))
-                wb = 0
+def run_loop_engine():
+    while True:
 
-                ia = extract_number(pam_cmd("IA"))
-                ib = extract_number(pam_cmd("IB"))
+        now = time.monotonic()
 
-                # -------- DWIN OUTPUT ----------
-                if mode_a:
-                    send_mode_to_dwin(mode_a)
+        if not poll_pam(now):
+            idle_until_due(now)
+            continue
 
-                if wa is not None:
-                    send_to_dwin(0x5500, scale_value(wa, mode_a, 195))
+        func = config_cache.get("FUNCTION")
+        if func is None:
+            time.sleep(0.1)
+            continue
 
-                send_to_dwin(0x5600, 0.0)
+        pump_dwin()
+        check_ain_modes(func, now)
+        publish(func)
 
-                if ia is not None:
-                    send_to_dwin(0x5700, ia / 10.0)
 
-                if ib is not None:
-                    send_to_dwin(0x5800, ib / 10.0)
+# -------------------------------------------------
+# MAIN LOOP
+# -------------------------------------------------
 
-                send_to_dwin(0x5900, 24.0)
+if __name__ == "__main__":
+    print(f"\n--- SYSTEM RUNNING ({PVC_ENGINE} engine) ---")
 
-            # ================= SAVE FOR BLE =================
-            with state_lock:
-                machine_state["FUNC"] = func
-                machine_state["WA"] = scale_value(wa, mode_a, func)
-                machine_state["WB"] = scale_value(wb, mode_b, func)
-                machine_state["IA"] = ia
-                machine_state["IB"] = ib
-                machine_state["MODE"] = mode_a
+    # Start BLE in background
+    threading.Thread(target=start_ble, daemon=True).start()
 
-            time.sleep(MAIN_LOOP_DELAY)
+    try:
+        if PVC_ENGINE == "asyncio":
+            asyncio.run(run_async_engine())
+        else:
+            run_loop_engine()
 
     except KeyboardInterrupt:
         print("\n--- SYSTEM STOPPED ---")
@@ -1,9 +1,31 @@
 #!/usr/bin/env python3
+"""BLE notification load generator, to find the ceiling of BlueZ on the Pi.
+
+Notifies synthetic payloads on CHAR_UUID at a set rate and prints what
+was achieved:
+
+    ./pi_to_mobile.py --rate 200 --size 100 --burst 4 --duration 30
+    ./pi_to_mobile.py --rate 50 --duty 2:1      # 2 s on, 1 s off
+
+Each payload starts with a u32 sequence number and the u32 send time
+(CLOCK_MONOTONIC in us, wraps), both little-endian, padded to --size, so a
+central can count gaps and latency (ble_standin.py --seq does).
+
+Bursts that come due while the loop is still busy with earlier ones are
+coalesced: skipped and counted, unless --catch-up sends them all late.
+Above ~500 notifications/s, raise --burst instead of --rate alone, as the
+GLib timers only have ms resolution.
+"""
+import argparse
 import dbus
 import dbus.mainloop.glib
 import dbus.service
+import json
+import math
+import os
+import struct
 import time
-import threading
+from collections import Counter
 from gi.repository import GLib
 
 BLUEZ_SERVICE_NAME = "org.bluez"
@@ -14,13 +36,27 @@ GATT_SERVICE_IFACE = "org.bluez.GattService1"
 GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
 LE_ADVERTISEMENT_IFACE = "org.bluez.LEAdvertisement1"
 PROP_IFACE = "org.freedesktop.DBus.Properties"
+NO_INVALIDATED = dbus.Array([], signature="s")
 
 # Your custom UUIDs (keep them fixed forever)
 SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
 CHAR_UUID    = "12345678-1234-5678-1234-56789abcdef1"
 
+# Start of every load payload: sequence number, send time in us
+LOAD_HEADER = struct.Struct("<II")
+# Tick lateness is counted in buckets of this many seconds
+LATE_BUCKET = 1e-4
+
+# "system" for BlueZ, or the address of a stand-in bus (ble_standin.py)
+BLE_BUS = os.environ.get("BLE_BUS", "system")
+
 MAIN_LOOP = None
 
+def open_ble_bus():
+    if BLE_BUS == "system":
+        return dbus.SystemBus()
+    return dbus.bus.BusConnection(BLE_BUS)
+
 def find_adapter(bus):
     om = dbus.Interface(bus.get_object(BLUEZ_SERVICE_NAME, "/"), DBUS_OM_IFACE)
     objects = om.GetManagedObjects()
@@ -81,7 +117,8 @@ class Characteristic(dbus.service.Object):
         self.flags = flags
         self.service = service
         self.notifying = False
-        self.value = [dbus.Byte(0)]
+        self.value = b"\x00"
+        self.changed = dbus.Dictionary({}, signature="sv")
         dbus.service.Object.__init__(self, bus, self.path)
 
     def get_path(self):
@@ -96,11 +133,15 @@ class Characteristic(dbus.service.Object):
             }
         }
 
-    def _notify_value(self, text: str):
+    def _notify_value(self, data):
+        # Same single "ay" notify path as pam_to_dwin_v2.py
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.value = data
         if not self.notifying:
             return
-        data = [dbus.Byte(b) for b in text.encode("utf-8")]
-        self.PropertiesChanged(GATT_CHRC_IFACE, {"Value": data}, [])
+        self.changed["Value"] = dbus.ByteArray(data)
+        self.PropertiesChanged(GATT_CHRC_IFACE, self.changed, NO_INVALIDATED)
 
     @dbus.service.method(PROP_IFACE, in_signature="ss", out_signature="v")
     def Get(self, interface, prop):
@@ -124,7 +165,7 @@ class Characteristic(dbus.service.Object):
     @dbus.service.method(GATT_CHRC_IFACE, in_signature="a{sv}", out_signature="ay")
     def ReadValue(self, options):
         # return last value (optional)
-        return dbus.Array(self.value, signature="y")
+        return dbus.ByteArray(self.value)
 
     @dbus.service.method(GATT_CHRC_IFACE, in_signature="aya{sv}")
     def WriteValue(self, value, options):
@@ -139,22 +180,120 @@ class Characteristic(dbus.service.Object):
     def StopNotify(self):
         self.notifying = False
 
+def percentiles(hist, points):
+    """{p: bucket} for a {bucket: count} histogram, in one pass."""
+    total = sum(hist.values())
+    ranks = sorted((int(round(p / 100 * (total - 1))), p) for p in points)
+    out = {}
+    seen = 0
+    for bucket in sorted(hist):
+        seen += hist[bucket]
+        while ranks and ranks[0][0] < seen:
+            out[ranks.pop(0)[1]] = bucket
+    return out
+
 class SjrdDataCharacteristic(Characteristic):
-    def __init__(self, bus, index, service):
+    def __init__(self, bus, index, service, rate=1.0, size=20, burst=1,
+                 duty=None, catch_up=False):
         super().__init__(bus, index, CHAR_UUID, ["read", "notify"], service)
+        self.period = burst / rate
+        self.burst = burst
+        self.duty = duty
+        self.catch_up = catch_up
+        self.payload = bytearray(max(LOAD_HEADER.size, size))
+        self.seq = 0
+
+        self.started = None
+        self.next_at = None
+        self.sent = 0
+        self.unsubscribed = 0     # due while nobody was subscribed
+        self.coalesced = 0        # due while the loop was still busy
+        self.errors = 0
+        self.lateness = Counter()     # LATE_BUCKET -> ticks
+        self.emit_s = 0.0
 
     def start_sending(self):
-        def loop():
-            i = 0
-            while True:
-                # Replace this with your real sensor/data
-                msg = f"{i}\n"
-                self._notify_value(msg)
-                i += 1
-                time.sleep(1)
-
-        t = threading.Thread(target=loop, daemon=True)
-        t.start()
+        self.started = self.next_at = time.monotonic()
+        self._schedule()
+
+    def _schedule(self):
+        delay = max(0.0, self.next_at - time.monotonic())
+        GLib.timeout_add(int(math.ceil(delay * 1000)), self._tick)
+
+    def _in_pause(self, now):
+        if not self.duty:
+            return False
+        on, off = self.duty
+        phase = (now - self.started) % (on + off)
+        if phase < on:
+            return False
+        # Resume with the next "on" phase
+        self.next_at = now + on + off - phase
+        return True
+
+    def _tick(self):
+        now = time.monotonic()
+        if self._in_pause(now):
+            self._schedule()
+            return False
+
+        due = int((now - self.next_at) / self.period) + 1
+        self.lateness[int((now - self.next_at) / LATE_BUCKET)] += 1
+        self.next_at += due * self.period
+        if not self.catch_up:
+            self.coalesced += (due - 1) * self.burst
+            due = 1
+        for _ in range(due * self.burst):
+            self._send_one()
+        self._schedule()
+        return False
+
+    def _send_one(self):
+        if not self.notifying:
+            self.unsubscribed += 1
+            return
+        t = time.monotonic()
+        LOAD_HEADER.pack_into(self.payload, 0, self.seq,
+                              int(t * 1e6) & 0xFFFFFFFF)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        try:
+            self._notify_value(bytes(self.payload))
+        except dbus.exceptions.DBusException as e:
+            self.errors += 1
+            print("❌ Notify failed:", e)
+            return
+        self.emit_s += time.monotonic() - t
+        self.sent += 1
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        result = {
+            "seconds": round(elapsed, 3),
+            "target_per_s": round(self.burst / self.period, 2),
+            "sent": self.sent,
+            "per_s": round(self.sent / elapsed, 2) if elapsed else 0.0,
+            "bytes_per_s": round(self.sent * len(self.payload) / elapsed)
+            if elapsed else 0,
+            "size": len(self.payload),
+            "burst": self.burst,
+            "coalesced": self.coalesced,
+            "unsubscribed": self.unsubscribed,
+            "errors": self.errors,
+        }
+        if self.sent:
+            result["emit_us"] = round(self.emit_s * 1e6 / self.sent, 1)
+        if self.lateness:
+            result["late_ms"] = {
+                f"p{p}": round(bucket * LATE_BUCKET * 1000, 3)
+                for p, bucket in percentiles(self.lateness, (50, 99)).items()}
+        return result
+
+    def report(self):
+        r = self.summary()
+        print(f"📶 {r['per_s']}/s of {r['target_per_s']}/s, "
+              f"{r['bytes_per_s']} B/s, coalesced {r['coalesced']}, "
+              f"unsubscribed {r['unsubscribed']}, errors {r['errors']}")
+        return True
 
 class Advertisement(dbus.service.Object):
     def __init__(self, bus, index, adapter_path):
@@ -188,10 +327,41 @@ class Advertisement(dbus.service.Object):
     def Release(self):
         pass
 
-def main():
+def parse_duty(text):
+    try:
+        on, off = (float(x) for x in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected ON:OFF seconds: {text}")
+    if not (on > 0 and off >= 0):
+        raise argparse.ArgumentTypeError(
+            "ON must be positive and OFF not negative")
+    return on, off
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rate", type=float, default=1.0,
+                   help="notifications per second")
+    p.add_argument("--size", type=int, default=20,
+                   help=f"payload bytes (at least {LOAD_HEADER.size})")
+    p.add_argument("--burst", type=int, default=1,
+                   help="notifications sent back to back per tick")
+    p.add_argument("--duty", type=parse_duty, metavar="ON:OFF",
+                   help="send for ON seconds, pause for OFF seconds")
+    p.add_argument("--catch-up", action="store_true",
+                   help="send late bursts instead of coalescing them")
+    p.add_argument("--duration", type=float, default=0.0,
+                   help="stop after this many seconds (0: run until ^C)")
+    p.add_argument("--report", type=float, default=5.0,
+                   help="seconds between progress lines")
+    args = p.parse_args()
+    if args.rate <= 0:
+        p.error("--rate must be positive")
+    return args
+
+def main(args):
     global MAIN_LOOP
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
-    bus = dbus.SystemBus()
+    bus = open_ble_bus()
 
     adapter = find_adapter(bus)
     if not adapter:
@@ -201,7 +371,8 @@ def main():
     # Build GATT app
     app = Application(bus)
     service = Service(bus, 0, SERVICE_UUID, True)
-    ch = SjrdDataCharacteristic(bus, 0, service)
+    ch = SjrdDataCharacteristic(bus, 0, service, args.rate, args.size,
+                                max(1, args.burst), args.duty, args.catch_up)
     service.add_characteristic(ch)
     app.add_service(service)
 
@@ -216,6 +387,10 @@ def main():
     def on_app_registered():
         print("GATT application registered")
         ch.start_sending()
+        if args.report:
+            GLib.timeout_add(int(args.report * 1000), ch.report)
+        if args.duration:
+            GLib.timeout_add(int(args.duration * 1000), MAIN_LOOP.quit)
 
     def on_app_error(e):
         print("Failed to register application:", e)
@@ -233,11 +408,14 @@ def main():
 
     try:
         MAIN_LOOP.run()
+    except KeyboardInterrupt:
+        pass
     finally:
         try:
             ad_manager.UnregisterAdvertisement(adv.get_path())
         except:
             pass
+        print(json.dumps(ch.summary(), indent=2))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(parse_args())
\ No newline at end of file
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Latest-value-wins output gate for one sink (BLE link, display, ...).
+
+Producers offer() fresh values as often as they like; only the newest
+value per field is kept. take() hands out the fields that moved by more
+than their deadband since they were last sent, but not more often than
+once per min_interval:
+
+    gate = OutputLimiter(0.2, {"IA": 1.0})
+    gate.offer({"IA": 812, "MODE": "V"})
+    changed = gate.take(time.monotonic())   # None: nothing to send yet
+"""
+
+
+def within_deadband(old, new, band):
+    """True if new is not worth sending after old."""
+    if old is None or new is None:
+        return old is new
+    if not band:
+        return old == new
+    try:
+        return abs(new - old) <= band
+    except TypeError:
+        return old == new
+
+
+class OutputLimiter:
+    def __init__(self, min_interval, deadbands=None):
+        self.min_interval = min_interval
+        self.deadbands = dict(deadbands or {})
+        self.sent = {}
+        self.pending = {}
+        self.next_at = 0.0
+        self.offered = 0
+        self.taken = 0
+
+    def offer(self, fields):
+        sent = self.sent
+        pending = self.pending
+        bands = self.deadbands
+        self.offered += 1
+        for name, value in fields.items():
+            if name in sent and within_deadband(sent[name], value,
+                                                bands.get(name)):
+                # Back where the sink already is: drop older pending value
+                pending.pop(name, None)
+            else:
+                pending[name] = value
+
+    def ready(self, now):
+        return bool(self.pending) and now >= self.next_at
+
+    def wait_time(self, now):
+        """Seconds until take() could return something, None if idle."""
+        if not self.pending:
+            return None
+        return max(0.0, self.next_at - now)
+
+    def take(self, now):
+        if not self.ready(now):
+            return None
+        changed = self.pending
+        self.pending = {}
+        self.sent.update(changed)
+        self.next_at = now + self.min_interval
+        self.taken += 1
+        return changed
+
+    def force(self):
+        """Treat everything as unsent, e.g. for a new subscriber."""
+        for name, value in self.sent.items():
+            self.pending.setdefault(name, value)
+        self.sent.clear()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Immutable machine-state snapshots shared between acquisition and sinks.
+
+The acquisition loop builds a new StateSnapshot for every committed
+sample and publishes it by rebinding one module-level name. Rebinding a
+reference is atomic in CPython, so readers (BLE, tools) take the current
+object without a lock and always see a consistent set of fields with the
+sequence number and monotonic timestamp they were committed with.
+"""
+from collections import namedtuple
+
+# MODE is AINA's V/C (what the text packet has always called MODE),
+# MODE_B is AINB's, PAM_MODE the amplifier's STD/EXP setting
+FIELDS = ("FUNC", "WA", "WB", "IA", "IB", "MODE", "MODE_B", "PAM_MODE")
+
+
+class StateSnapshot(namedtuple("StateSnapshot", ("seq", "t") + FIELDS)):
+    __slots__ = ()
+
+    @classmethod
+    def empty(cls):
+        return cls(0, 0.0, *([None] * len(FIELDS)))
+
+    def next(self, t, **fields):
+        """The snapshot that follows this one."""
+        return StateSnapshot(self.seq + 1, t, *(fields.get(name)
+                                                for name in FIELDS))
+
+    # Mapping-style access by field name, as the sinks use it
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            # Fields only: getattr alone would also find count(), index()
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, name, default=None):
+        if name not in self._fields:
+            return default
+        return getattr(self, name)
+
+    def items(self):
+        return zip(FIELDS, self[2:])
@@ -0,0 +1,87 @@
+import pytest
+
+import ble_commands
+from ble_commands import CommandJob, parse
+from pam_link import OK, TIMEOUT, PamResponse
+
+
+def refused(data, function=196):
+    with pytest.raises(ValueError) as e:
+        parse(data, function)
+    return str(e.value)
+
+
+def test_function_switch():
+    assert parse(b"195", 196) == ("195", ["FUNCTION 195"])
+    assert "unknown function" in refused(b"197")
+
+
+@pytest.mark.parametrize("data, reason", [
+    (b"", "empty"),
+    (b"  \r\n", "empty"),
+    (b"\xff", "not ASCII"),
+    ("CURA:1200:196".encode("utf-16"), "not ASCII"),
+    ("VOLTAGE\u00e9".encode("utf-8"), "not ASCII"),
+    (b"hello", "unknown command"),
+])
+def test_empty_and_non_ascii(data, reason):
+    assert refused(data) == reason
+
+
+@pytest.mark.parametrize("value", [499, 2601, 0, 99999])
+def test_current_out_of_range(value):
+    assert "out of range" in refused(f"CURA:{value}:196".encode())
+
+
+@pytest.mark.parametrize("value", [500, 2600])
+def test_current_limits_pass_validation(value):
+    # In range, but not sent until the PAM command is confirmed
+    assert "no confirmed PAM command" in refused(f"CURA:{value}:196".encode())
+
+
+def test_current_function_suffix():
+    assert "is for function 195" in refused(b"CUR:1200:196")
+    assert "is for function 196" in refused(b"CURB:1200:195", 195)
+    assert "PAM runs function 196" in refused(b"CUR:1200:195", 196)
+    assert refused(b"CURA:12x0:196") == "bad number"
+    assert refused(b"CURA:1200") == "unknown command"
+
+
+def test_bare_ain_only_under_195():
+    assert parse(b"voltage", 195) == ("VOLTAGE", ["AINA V"])
+    assert parse(b"CURRENT\n", 195) == ("CURRENT", ["AINA C"])
+    # Two inputs: guessing could write the wrong one
+    assert "AINA:/AINB:" in refused(b"CURRENT", 196)
+    assert "AINA:/AINB:" in refused(b"VOLTAGE", None)
+
+
+def test_explicit_channels():
+    assert parse(b"AINB:CURRENT", 196) == ("AINB:CURRENT", ["AINB C"])
+    assert parse(b"AINA:V", 196) == ("AINA:V", ["AINA V"])
+    assert "unknown input mode" in refused(b"AINB:X")
+
+
+def test_command_job():
+    job = CommandJob("VOLTAGE", ("AINA V",), queued=1.0)
+    assert job.cmds == ["AINA V"]
+    assert job.queued == 1.0
+    assert CommandJob("196", ["FUNCTION 196"]).queued > 0
+
+
+def test_ack_carries_reply_and_times():
+    job = CommandJob("AINB:C", ["AINB C"], queued=10.0)
+    replies = [PamResponse("AINB C", "AINB C\r\nC\r\n>", OK, 0.0123)]
+    ack = ble_commands.encode_ack(job, replies, started=10.002).decode()
+    assert ack == "ACK:AINB C,STATUS:ok,RTT:12.3,WAIT:2.0,REPLY:C\n"
+
+
+def test_ack_statuses():
+    job = CommandJob("196", ["FUNCTION 196"], queued=0.0)
+    err = [PamResponse("FUNCTION 196", "FUNCTION 196\r\nERR\r\n>", OK, 0.01)]
+    assert b"STATUS:err" in ble_commands.encode_ack(job, err, 0.0)
+    lost = [PamResponse("FUNCTION 196", "", TIMEOUT, 0.15)]
+    assert b"STATUS:timeout" in ble_commands.encode_ack(job, lost, 0.0)
+    assert b"STATUS:error" in ble_commands.encode_ack(job, None, 0.0)
+    reject = ble_commands.encode_reject(b"CURA:1:196", "out of range (a,b)")
+    assert reject == (b"ACK:CURA 1 196,STATUS:rejected,"
+                      b"REASON:out of range (a b)\n")
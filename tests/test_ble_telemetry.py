@@ -0,0 +1,122 @@
+import pytest
+
+from ble_telemetry import (KEYFRAME, STATUS_FIELDS, DeltaDecoder,
+                           DeltaEncoder, SampleBatcher, decode_batch,
+                           encode_status, record_fields)
+
+
+def state(**values):
+    base = {"FUNC": 196, "WA": 1.25, "WB": -0.5, "IA": 812.0, "IB": 790.0,
+            "MODE": "V", "PIN15": False}
+    base.update(values)
+    return base
+
+
+def test_first_packet_is_a_keyframe():
+    enc = DeltaEncoder()
+    packet = enc.encode(state(), 0.0)
+    assert packet[2] & KEYFRAME
+    assert DeltaDecoder().feed(packet) == record_fields(state())
+
+
+def test_round_trip_sends_only_changes():
+    enc, dec = DeltaEncoder(keyframe_interval=5.0), DeltaDecoder()
+    dec.feed(enc.encode(state(), 0.0))
+    assert enc.encode(state(), 0.1) is None
+    packet = enc.encode(state(IA=815.0), 0.2)
+    assert len(packet) == 3 + 2
+    assert dec.feed(packet) == record_fields(state(IA=815.0))
+    packet = enc.encode(state(IA=815.0, WA=None, MODE="C"), 0.3)
+    assert dec.feed(packet) == record_fields(
+        state(IA=815.0, WA=None, MODE="C"))
+
+
+def test_keyframe_interval_and_request():
+    enc = DeltaEncoder(keyframe_interval=1.0)
+    enc.encode(state(), 0.0)
+    assert enc.encode(state(), 0.5) is None
+    assert enc.encode(state(), 1.0)[2] & KEYFRAME
+    enc.request_keyframe()
+    assert enc.encode(state(), 1.1)[2] & KEYFRAME
+
+
+def test_gap_waits_for_keyframe():
+    enc, dec = DeltaEncoder(keyframe_interval=10.0), DeltaDecoder()
+    dec.feed(enc.encode(state(), 0.0))
+    enc.encode(state(IA=1.0), 0.1)              # lost on the way
+    assert dec.feed(enc.encode(state(IA=2.0), 0.2)) is None
+    assert dec.gaps == 1
+    assert dec.feed(enc.encode(state(IB=3.0), 0.3)) is None
+    enc.request_keyframe()
+    assert dec.feed(enc.encode(state(IA=4.0), 0.4)) == record_fields(
+        state(IA=4.0))
+
+
+def test_sequence_wraps():
+    enc, dec = DeltaEncoder(), DeltaDecoder()
+    for i in range(300):
+        assert dec.feed(enc.encode(state(IA=float(i)), i * 0.01)) is not None
+    assert dec.gaps == 0
+
+
+def test_unknown_version():
+    with pytest.raises(ValueError):
+        DeltaDecoder().feed(b"\x09\x00\x80")
+
+
+def test_status_carries_only_known_keys():
+    line = encode_status(state(MODE_B="C", PAM_MODE="V")).decode()
+    assert line == "FUNC:196,MODE:V,MODE_B:C,PAM_MODE:V\n"
+    fields = [kv.split(":")[0] for kv in line.strip().split(",")]
+    assert tuple(fields) == STATUS_FIELDS
+
+
+def test_batch_capacity_per_mtu():
+    assert SampleBatcher.capacity(23) == 2
+    assert SampleBatcher.capacity(185) == 29
+    assert SampleBatcher.capacity(517) == 84
+    # Below the ATT minimum counts as the minimum
+    assert SampleBatcher.capacity(10) == 2
+
+
+def test_batch_count_capped_at_255():
+    assert SampleBatcher.capacity(4096) == 255
+    batcher = SampleBatcher(maxlen=300)
+    for i in range(300):
+        batcher.add(i * 0.001, 1.0, 2.0)
+    assert len(decode_batch(batcher.take(0.3, mtu=4096))) == 255
+    assert len(batcher.samples) == 45
+
+
+def test_partial_batch_waits_for_max_latency():
+    batcher = SampleBatcher(max_latency=0.1)
+    assert batcher.wait_time(0.0) is None
+    batcher.add(1.0, 5.0, 6.0)
+    assert batcher.take(1.05, mtu=185) is None
+    assert batcher.wait_time(1.05) == pytest.approx(0.05)
+    assert decode_batch(batcher.take(1.1, mtu=185)) == [(1000, 5, 6)]
+    assert batcher.take(1.2, mtu=185) is None
+
+
+def test_full_batch_leaves_at_once():
+    batcher = SampleBatcher(max_latency=10.0)
+    for t in (0.0, 0.01, 0.02):
+        batcher.add(t, 1.0, 1.0)
+    assert len(decode_batch(batcher.take(0.02))) == 2
+    assert len(batcher.samples) == 1
+
+
+def test_batch_round_trip_ms_deltas():
+    batcher = SampleBatcher(max_latency=0.0)
+    times = [12.0004, 12.0013, 12.0029, 12.0031, 12.5]
+    for t in times:
+        batcher.add(t, 812.4, None)
+    out = decode_batch(batcher.take(13.0, mtu=185))
+    # Whole-ms stamps: deltas never drift from the truncated times
+    assert [t for t, _, _ in out] == [int(t * 1000) for t in times]
+    assert all(ia == 812 and ib is None for _, ia, ib in out)
+
+
+def test_batch_unknown_version():
+    with pytest.raises(ValueError):
+        decode_batch(b"\x09\x00\x00\x00\x00\x00")
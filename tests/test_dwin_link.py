@@ -0,0 +1,101 @@
+from dwin_link import DwinWriter, runs
+
+
+def test_runs_split_on_gaps():
+    assert list(runs([])) == []
+    assert list(runs([0x1000])) == [[0x1000]]
+    assert list(runs([1, 2, 3, 5, 6, 9])) == [[1, 2, 3], [5, 6], [9]]
+
+
+def test_runs_split_at_max_words():
+    assert list(runs(range(7), max_words=3)) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+class Port:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+
+def test_flush_writes_adjacent_vps_in_one_frame():
+    w = DwinWriter(max_rate=0, max_stale=0, deadbands={})
+    for vp, word in ((0x2003, 3), (0x2001, 1), (0x2002, 2), (0x2010, 9)):
+        w.set(vp, word)
+    port = Port()
+    assert w.flush(port, now=0.0) == len(port.data)
+    assert bytes(port.data) == bytes.fromhex(
+        "5aa5 09 82 2001 0001 0002 0003"
+        "5aa5 05 82 2010 0009")
+    assert w.pending == {}
+
+
+def test_unchanged_and_deadband_values_are_not_resent():
+    w = DwinWriter(max_rate=0, max_stale=0, deadbands={0x2001: 2})
+    w.set(0x2000, 5)
+    w.set(0x2001, 100)
+    w.flush(Port(), now=0.0)
+    w.set(0x2000, 5)
+    w.set(0x2001, 102)
+    assert w.pending == {}
+    w.set(0x2001, 0xFFFF)           # -1: a big step in signed words
+    assert w.pending == {0x2001: 0xFFFF}
+
+
+def written_vps(data):
+    # One single-word 0x82 frame per VP: 5A A5 05 82 VP VP W W
+    return [int.from_bytes(data[i + 4:i + 6], "big")
+            for i in range(0, len(data), 8)]
+
+
+def stale_writer(trickle=2):
+    w = DwinWriter(max_rate=0, max_stale=1.0, trickle=trickle, deadbands={})
+    # Five VPs that never share a frame, sent 0.1 s apart
+    for k, vp in enumerate((0x10, 0x20, 0x30, 0x40, 0x50)):
+        w.set(vp, k + 1)
+        w.flush(Port(), now=k * 0.1)
+    return w
+
+
+def test_nothing_resent_before_max_stale():
+    w = stale_writer()
+    port = Port()
+    assert w.flush(port, now=0.99) == 0
+    assert w.refreshed == 0
+    w.flush(port, now=1.0)
+    assert written_vps(port.data) == [0x10]
+
+
+def test_trickle_refreshes_oldest_first():
+    w = stale_writer(trickle=2)
+    refreshed = []
+    for now in (2.0, 2.01, 2.02):
+        port = Port()
+        w.flush(port, now=now)
+        refreshed.append(written_vps(port.data))
+    assert refreshed == [[0x10, 0x20], [0x30, 0x40], [0x50]]
+    assert w.refreshed == 5
+    # Everything is fresh again: nothing until 2.0 + max_stale
+    assert w._check_at == 3.0
+    assert w.flush(Port(), now=2.5) == 0
+
+
+def test_pending_value_is_not_refreshed():
+    w = stale_writer(trickle=5)
+    w.set(0x30, 99)
+    port = Port()
+    w.flush(port, now=2.0)
+    assert sorted(written_vps(port.data)) == [0x10, 0x20, 0x30, 0x40, 0x50]
+    assert w.refreshed == 4
+    assert w.sent[0x30] == 99
+
+
+def test_resync_queues_every_known_vp():
+    w = stale_writer()
+    w.resync()
+    assert w.pending == w.sent
+    port = Port()
+    w.flush(port, now=0.5)
+    assert sorted(written_vps(port.data)) == [0x10, 0x20, 0x30, 0x40, 0x50]
+    assert w.refreshed == 0
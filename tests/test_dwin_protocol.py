@@ -0,0 +1,139 @@
+import struct
+
+from dwin_protocol import (CMD_READ, PAGE_MAGIC, VP_PAGE, VP_PIC_NOW,
+                           FrameBuilder, FrameDecoder, crc16)
+
+
+def test_crc16_modbus_check_value():
+    assert crc16(b"123456789") == 0x4B37
+    assert crc16(b"") == 0xFFFF
+
+
+def test_write_frame_layout():
+    b = FrameBuilder()
+    frame = bytes(b.write_words(0x1000, (1, 0xFFFF)))
+    assert frame == bytes.fromhex("5aa5 07 82 1000 0001 ffff")
+
+
+def test_write_frame_with_crc():
+    b = FrameBuilder(crc=True)
+    frame = bytes(b.write_words(0x1000, (1, 2)))
+    assert frame[2] == len(frame) - 3
+    crc = struct.unpack_from("<H", frame, len(frame) - 2)[0]
+    assert crc == crc16(frame[3:-2])
+
+
+def test_frames_accumulate_until_reset():
+    b = FrameBuilder()
+    b.put_write(0x2000, [7])
+    b.page_switch(3)
+    b.read_request(0x5100)
+    data = bytes(b.frames())
+    assert data == bytes.fromhex(
+        "5aa5 05 82 2000 0007"
+        "5aa5 07 82 %04x %04x 0003"
+        "5aa5 04 83 5100 01" % (VP_PAGE, PAGE_MAGIC))
+    b.reset()
+    assert bytes(b.frames()) == b""
+
+
+def test_read_request_with_crc():
+    frame = bytes(FrameBuilder(crc=True).read_request(0x5100, 2))
+    assert frame[:7] == bytes([0x5A, 0xA5, 6, CMD_READ, 0x51, 0x00, 2])
+    assert struct.unpack("<H", frame[7:])[0] == crc16(frame[3:7])
+
+
+def test_buffer_grows_and_keeps_frames():
+    b = FrameBuilder(capacity=8)
+    for vp in range(10):
+        b.put_write(vp, [vp])
+    data = bytes(b.frames())
+    assert len(data) == 10 * 8
+    assert data[-8:] == bytes.fromhex("5aa5 05 82 0009 0009")
+
+
+# -------------------------------------------------
+# DECODER
+# -------------------------------------------------
+
+
+def reply(vp, words, crc=False):
+    """A 0x83 frame as the display sends it."""
+    body = struct.pack(">BHB%dH" % len(words), CMD_READ, vp, len(words),
+                       *words)
+    if crc:
+        body += struct.pack("<H", crc16(body))
+    return b"\x5a\xa5" + bytes([len(body)]) + body
+
+
+def decoder(crc=False):
+    got = []
+    dec = FrameDecoder(crc=crc, default=lambda vp, words: got.append(
+        (vp, words)))
+    return dec, got
+
+
+def test_reply_round_trip_by_vp():
+    dec, got = decoder()
+    page = []
+    dec.on_vp(VP_PIC_NOW, lambda vp, words: page.append(words))
+    dec.feed(reply(VP_PIC_NOW, [28]) + reply(0x5100, [1, 2]))
+    assert page == [(28,)]
+    assert got == [(0x5100, (1, 2))]
+    assert dec.frames == 2 and dec.bad_bytes == 0
+
+
+def test_split_frame_is_kept_for_next_feed():
+    dec, got = decoder(crc=True)
+    data = reply(0x5100, [1], crc=True)
+    for i in range(len(data)):
+        dec.feed(data[i:i + 1])
+    assert got == [(0x5100, (1,))]
+    assert dec.buf == bytearray()
+
+
+def test_write_ack_is_counted():
+    dec, got = decoder()
+    dec.feed(b"\x5a\xa5\x03\x82OK")
+    assert dec.acks == 1 and got == []
+
+
+def test_resync_after_garbage():
+    dec, got = decoder()
+    dec.feed(b"\x00\x5a\x13" + reply(0x5100, [1]) + b"\xff")
+    assert got == [(0x5100, (1,))]
+    assert dec.bad_bytes == 4
+
+
+def test_resync_after_truncated_header():
+    dec, got = decoder()
+    # A header whose frame never came, followed by a good frame
+    dec.feed(b"\x5a\xa5\x01" + reply(0x5100, [3]))
+    assert got == [(0x5100, (3,))]
+    assert dec.bad_bytes == 3
+
+
+def test_bad_word_count_is_skipped():
+    dec, got = decoder()
+    bad = bytearray(reply(0x5100, [1, 2]))
+    bad[6] = 3                      # claims three words, carries two
+    dec.feed(bytes(bad) + reply(0x5100, [4]))
+    assert got == [(0x5100, (4,))]
+
+
+def test_crc_error_resyncs():
+    dec, got = decoder(crc=True)
+    bad = bytearray(reply(0x5100, [1], crc=True))
+    bad[-1] ^= 0xFF
+    dec.feed(bytes(bad) + reply(0x5100, [2], crc=True))
+    assert dec.crc_errors == 1
+    assert got == [(0x5100, (2,))]
+
+
+def test_lone_header_byte_is_kept():
+    dec, got = decoder()
+    data = reply(0x5100, [5])
+    dec.feed(b"\x01\x02" + data[:1])
+    assert dec.bad_bytes == 2
+    dec.feed(data[1:])
+    assert got == [(0x5100, (5,))]
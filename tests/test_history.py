@@ -0,0 +1,111 @@
+import struct
+import threading
+
+import pytest
+
+from history import (KIND_DATA, KIND_END, HistoryRing, decode_block,
+                     packets)
+
+_PACKET = struct.Struct("<BHBB")
+
+
+def filled(n, capacity=100, step=0.01):
+    ring = HistoryRing(capacity)
+    for k in range(n):
+        ring.append(10.0 + k * step, k / 1000, -k / 1000, k, None)
+    return ring
+
+
+def samples(ring, t0, t1, block_samples=256):
+    out = []
+    for block in ring.blocks(t0, t1, block_samples):
+        out += decode_block(block)
+    return out
+
+
+def test_round_trip():
+    ring = filled(10)
+    got = samples(ring, 0.0, 100.0)
+    assert len(got) == 10
+    assert got[0] == (10000, 0.0, 0.0, 0, None)
+    assert got[3] == (10030, 0.003, -0.003, 3, None)
+    assert [s[0] for s in got] == list(range(10000, 10100, 10))
+
+
+def test_range_and_block_size():
+    ring = filled(50)
+    blocks = list(ring.blocks(10.1, 10.3, block_samples=8))
+    assert len(blocks) == 3             # samples 10..30
+    got = [s for b in blocks for s in decode_block(b)]
+    assert got[0][0] == 10100 and got[-1][0] == 10300
+    assert list(ring.blocks(20.0, 30.0)) == []
+
+
+def test_wraps_and_keeps_newest():
+    ring = filled(130, capacity=100)
+    assert len(ring) == 100
+    assert ring.oldest() == pytest.approx(10.3)
+    assert ring.newest() == pytest.approx(11.29)
+    got = samples(ring, 0.0, 100.0, block_samples=32)
+    assert [s[3] for s in got] == list(range(30, 130))
+
+
+def test_empty_ring():
+    ring = HistoryRing(4)
+    assert ring.oldest() is None and ring.newest() is None
+    assert list(ring.blocks(0.0, 1.0)) == []
+
+
+def test_packets_reassemble():
+    ring = filled(100)
+    blocks = list(ring.blocks(0.0, 100.0, block_samples=40))
+    parts = {}
+    out = list(packets(blocks, mtu=23))
+    for p in out:
+        kind, block, part, nparts = _PACKET.unpack_from(p)
+        assert len(p) <= 23 - 3
+        if kind == KIND_DATA:
+            parts.setdefault(block, []).append(p[_PACKET.size:])
+    kind, count, _, _ = _PACKET.unpack_from(out[-1])
+    assert kind == KIND_END and count == len(blocks)
+    assert [b"".join(parts[i]) for i in range(count)] == blocks
+
+
+def test_packets_without_blocks():
+    assert list(packets([])) == [_PACKET.pack(KIND_END, 0, 0, 0)]
+
+
+def test_samples_overwritten_during_transfer_are_skipped():
+    ring = filled(100, capacity=100)
+    blocks = ring.blocks(0.0, 100.0, block_samples=10)
+    first = decode_block(next(blocks))
+    # The acquisition thread moves on by 25 samples meanwhile
+    for k in range(100, 125):
+        ring.append(10.0 + k * 0.01, 0, 0, k, None)
+    rest = [s for b in blocks for s in decode_block(b)]
+    assert [s[3] for s in first] == list(range(10))
+    assert [s[3] for s in rest] == list(range(25, 100))
+
+
+def test_append_while_reading():
+    ring = HistoryRing(1000)
+    stop = threading.Event()
+
+    def writer():
+        k = 0
+        while not stop.is_set():
+            ring.append(k * 0.001, 0, 0, k % 30000, 0)
+            k += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(50):
+            for block in ring.blocks(0.0, 1e9, block_samples=64):
+                ias = [s[3] for s in decode_block(block)]
+                # Each block is one consistent copy: no holes inside
+                assert all((b - a) % 30000 == 1
+                           for a, b in zip(ias, ias[1:]))
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,116 @@
+from mode_mismatch import AWAIT, IDLE, VERIFY, MismatchWorkflow
+
+
+class Recorder:
+    def __init__(self, **kwargs):
+        self.calls = []
+        self.wf = MismatchWorkflow(
+            show_page=lambda retry: self.calls.append(
+                "reshow" if retry else "show"),
+            request_selection=lambda: self.calls.append("request"),
+            apply_mode=lambda mode: self.calls.append(("apply", mode)),
+            reread_modes=lambda: self.calls.append("reread"),
+            restore_page=lambda: self.calls.append("restore"),
+            **kwargs)
+
+
+def test_no_mismatch_stays_idle():
+    r = Recorder()
+    r.wf.step(0.0, "V", "V")
+    r.wf.step(0.1, None, "C")       # AINA not read yet
+    assert r.wf.state == IDLE and r.calls == []
+
+
+def test_selection_applied_and_verified():
+    r = Recorder(poll_interval=0.15)
+    wf = r.wf
+    wf.step(0.0, "V", "C")
+    assert wf.state == AWAIT and wf.active
+    assert r.calls == ["show"]
+    wf.step(0.0, "V", "C")
+    wf.step(0.1, "V", "C")          # before the next poll is due
+    wf.step(0.2, "V", "C")
+    assert r.calls == ["show", "request", "request"]
+    wf.step(0.3, "V", "C", selection=1)
+    assert wf.state == VERIFY and wf.selected == "C"
+    assert r.calls[-2:] == [("apply", "C"), "reread"]
+    wf.step(0.4, "C", "C")
+    assert wf.state == IDLE
+    assert r.calls[-1] == "restore"
+
+
+def test_unknown_selection_is_ignored():
+    r = Recorder()
+    r.wf.step(0.0, "V", "C")
+    r.wf.step(0.0, "V", "C", selection=7)
+    assert r.wf.state == AWAIT
+    assert ("apply", None) not in r.calls
+
+
+def test_verify_timeout_asks_again():
+    r = Recorder(verify_timeout=1.0)
+    wf = r.wf
+    wf.step(0.0, "V", "C")
+    wf.step(0.1, "V", "C", selection=0)
+    wf.step(0.5, "V", "C")
+    assert wf.state == VERIFY
+    wf.step(1.2, "V", "C")
+    assert wf.state == AWAIT and wf.selected is None
+    assert r.calls.count("show") == 1
+    assert r.calls.count("reshow") == 1
+
+
+def test_modes_agree_while_waiting():
+    r = Recorder()
+    r.wf.step(0.0, "V", "C")
+    r.wf.step(0.1, "C", "C")        # fixed elsewhere, e.g. over BLE
+    assert r.wf.state == IDLE
+    assert r.calls[-1] == "restore"
+
+
+def test_auto_upload_does_not_poll():
+    r = Recorder(auto_upload=True)
+    r.wf.step(0.0, "V", "C")
+    r.wf.step(1.0, "V", "C")
+    assert "request" not in r.calls
+
+
+def test_cancel_restores_only_when_active():
+    r = Recorder()
+    r.wf.cancel()
+    assert r.calls == []
+    r.wf.step(0.0, "V", "C")
+    r.wf.cancel()
+    assert r.wf.state == IDLE and r.calls[-1] == "restore"
+
+
+class Display:
+    """Page handling as the scripts do it: PIC_NOW is read on show."""
+
+    def __init__(self, page):
+        self.page = page
+        self.saved = None
+
+    def show(self, retry):
+        if not retry:
+            self.saved = self.page
+        self.page = 28
+
+    def restore(self):
+        if self.saved is not None and self.saved != 28:
+            self.page = self.saved
+        self.saved = None
+
+
+def test_page_restored_after_verify_retry():
+    disp = Display(page=3)
+    wf = MismatchWorkflow(disp.show, lambda: None, lambda mode: None,
+                          lambda: None, disp.restore, verify_timeout=1.0)
+    wf.step(0.0, "V", "C")
+    assert disp.page == 28
+    wf.step(0.1, "V", "C", selection=1)
+    wf.step(1.5, "V", "C")                  # verify timed out: ask again
+    assert wf.state == AWAIT and disp.page == 28
+    wf.step(1.6, "C", "C")
+    assert wf.state == IDLE
+    assert disp.page == 3
@@ -0,0 +1,48 @@
+from pam_cache import CONFIG_REGISTERS, RegisterCache
+
+
+def test_store_reports_changes_only():
+    cache = RegisterCache()
+    assert cache.store("AINA", "V") is False    # first read
+    assert cache.store("AINA", "V") is False
+    assert cache.store("AINA", "C") is True
+    assert cache.get("AINA") == "C"
+
+
+def test_missing_until_stored():
+    cache = RegisterCache()
+    assert cache.missing() == list(CONFIG_REGISTERS)
+    cache.store("FUNCTION", "196")
+    assert "FUNCTION" not in cache.missing()
+    assert cache.missing(["FUNCTION", "AINB", "SUPPLY"]) == ["AINB"]
+
+
+def test_invalidate_some_or_all():
+    cache = RegisterCache()
+    for name in CONFIG_REGISTERS:
+        cache.store(name, "x")
+    cache.invalidate("AINA", "UNKNOWN")
+    assert cache.get("AINA") is None
+    assert cache.get("AINB") == "x"
+    cache.invalidate()
+    assert cache.missing() == list(CONFIG_REGISTERS)
+
+
+def test_written_drops_set_register():
+    cache = RegisterCache()
+    cache.store("AINA", "V")
+    cache.store("AINB", "V")
+    cache.written("AINA")           # a read, not a write
+    assert cache.get("AINA") == "V"
+    cache.written("AINB C")
+    assert cache.get("AINB") is None
+    assert cache.get("AINA") == "V"
+    cache.written("SUPPLY 1")       # not cached
+    assert "SUPPLY" not in cache
+
+
+def test_store_after_invalidate_is_not_a_change():
+    cache = RegisterCache()
+    cache.store("MODE", "V")
+    cache.invalidate("MODE")
+    assert cache.store("MODE", "C") is False
@@ -0,0 +1,102 @@
+import pam_link
+from pam_link import OK, PARTIAL, TIMEOUT, PamLink, ReplyCollector
+
+
+class FakePort:
+    """Serial port that hands out a scripted reply in chunks."""
+
+    def __init__(self, chunks=()):
+        self.chunks = list(chunks)
+        self.written = bytearray()
+        self.resets = 0
+
+    def reset_input_buffer(self):
+        self.resets += 1
+
+    def write(self, data):
+        self.written += data
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, n):
+        return self.chunks.pop(0)
+
+
+def link(chunks, terminator="prompt", timeout=0.05):
+    lk = PamLink(FakePort(chunks), timeout=timeout, terminator=terminator)
+    # No real fd to select() on: just let the deadline run out
+    lk._wait_readable = lambda remaining: None
+    return lk
+
+
+def test_query_ok_across_chunks():
+    lk = link([b"FUNCTION\r\n", b"196\r\n", b">"])
+    resp = lk.query("FUNCTION")
+    assert resp.status == OK and resp.ok
+    assert resp.text == "FUNCTION\r\n196\r\n>"
+    assert lk.port.written == b"FUNCTION\r\n"
+    assert lk.port.resets == 1
+
+
+def test_query_partial_without_prompt():
+    resp = link([b"AINA\r\nV\r\n"]).query("AINA")
+    assert resp.status == PARTIAL
+    assert not resp.ok
+    assert "V" in resp.text
+    assert resp.rtt >= 0.05
+
+
+def test_query_timeout_without_reply():
+    resp = link([]).query("AINB", timeout=0.01)
+    assert resp.status == TIMEOUT
+    assert resp.text == ""
+
+
+def test_eol_terminator_skips_echo():
+    lk = link([b"AINA\r\n", b"C\r\n"], terminator="eol")
+    resp = lk.query("AINA")
+    assert resp.status == OK
+    assert resp.text == "AINA\r\nC\r\n"
+
+
+def test_query_many_splits_by_prompt():
+    lk = link([b"FUNCTION\r\n195\r\n>AINA\r\nV\r\n>", b"AINB\r\n"])
+    replies = lk.query_many(["FUNCTION", "AINA", "AINB"])
+    assert [r.status for r in replies] == [OK, OK, PARTIAL]
+    assert lk.port.written == b"FUNCTION\r\nAINA\r\nAINB\r\n"
+
+
+def test_collector_lost_prompt_marks_rest_partial():
+    lk = PamLink(FakePort(), timeout=0.1)
+    col = ReplyCollector(lk, ["FUNCTION", "AINA", "AINB"], 0.1, start=0.0)
+    # FUNCTION's prompt went missing, so AINA is handed AINB's reply
+    col.feed(b"FUNCTION\r\n195\r\nAINA\r\nV\r\n>AINB\r\nC\r\n>", 0.01)
+    assert col.done
+    assert [r.status for r in col.replies] == [OK, PARTIAL, PARTIAL]
+
+
+def test_collector_finish_times_out_the_rest():
+    lk = PamLink(FakePort(), timeout=0.1)
+    col = ReplyCollector(lk, ["FUNCTION", "AINA"], 0.1, start=0.0)
+    col.feed(b"FUNCTION\r\n195\r\n>", 0.01)
+    replies = col.finish(0.2)
+    assert [r.status for r in replies] == [OK, TIMEOUT]
+    assert replies[1].rtt == 0.2
+
+
+def test_unknown_terminator():
+    try:
+        PamLink(FakePort(), terminator="crlf")
+    except ValueError as e:
+        assert "crlf" in str(e)
+    else:
+        raise AssertionError("accepted unknown terminator")
+
+
+def test_stats_recorded(monkeypatch):
+    monkeypatch.setattr(pam_link, "STATS_FILE", "unused")
+    monkeypatch.setattr(pam_link, "status_counts", pam_link.Counter())
+    link([b"MODE\r\nV\r\n>"]).query("MODE")
+    assert pam_link.status_counts[OK] == 1
@@ -0,0 +1,110 @@
+import pytest
+
+from pam_scheduler import (BACKOFF, BACKOFF_FLOOR, DEFAULT_REGISTERS,
+                           PollScheduler, registers_for)
+
+
+def scheduler():
+    return PollScheduler({
+        "IA": (0.0, 0.2, 0, 0.0),
+        "WA": (0.05, 0.5, 1, 0.01),
+        "AINA": (1.0, 10.0, 2, 0.0),
+    })
+
+
+def test_first_read_counts_as_change():
+    s = scheduler()
+    assert s.update("AINA", "V", 0.0) is True
+    assert s.registers["AINA"].next_due == 1.0
+
+
+def test_backoff_up_to_max_interval():
+    s = scheduler()
+    s.update("AINA", "V", 0.0)
+    intervals = []
+    now = 0.0
+    for _ in range(10):
+        now = s.registers["AINA"].next_due
+        assert s.update("AINA", "V", now) is False
+        intervals.append(s.registers["AINA"].interval)
+    assert intervals[0] == pytest.approx(1.0 * BACKOFF)
+    assert intervals[1] == pytest.approx(1.0 * BACKOFF ** 2)
+    assert intervals[-1] == 10.0
+    assert all(a <= b for a, b in zip(intervals, intervals[1:]))
+
+
+def test_zero_min_interval_still_backs_off():
+    s = scheduler()
+    s.update("IA", 800, 0.0)
+    s.update("IA", 800, 0.0)
+    assert s.registers["IA"].interval == pytest.approx(
+        BACKOFF_FLOOR * BACKOFF)
+
+
+def test_change_snaps_back_to_min_interval():
+    s = scheduler()
+    s.update("AINA", "V", 0.0)
+    for t in range(1, 6):
+        s.update("AINA", "V", float(t))
+    assert s.registers["AINA"].interval > 1.0
+    assert s.update("AINA", "C", 6.0) is True
+    assert s.registers["AINA"].interval == 1.0
+    assert s.registers["AINA"].next_due == 7.0
+
+
+def test_deadband():
+    s = scheduler()
+    s.update("WA", 1.000, 0.0)
+    assert s.update("WA", 1.008, 0.1) is False     # within 0.01
+    assert s.registers["WA"].interval > 0.05
+    assert s.update("WA", 1.05, 0.2) is True
+    assert s.registers["WA"].interval == 0.05
+
+
+def test_failed_read_retries_at_min_interval():
+    s = scheduler()
+    s.update("AINA", "V", 0.0)
+    s.update("AINA", "V", 1.0)
+    learnt = s.registers["AINA"].interval
+    assert s.update("AINA", None, 5.0) is False
+    reg = s.registers["AINA"]
+    assert reg.next_due == 6.0
+    # Keeps the value and the learnt interval
+    assert reg.interval == learnt and reg.value == "V"
+
+
+def test_due_orders_by_priority_then_time():
+    s = scheduler()
+    s.registers["AINA"].next_due = 0.1
+    s.registers["WA"].next_due = 0.5
+    s.registers["IA"].next_due = 0.9
+    assert s.due(1.0) == ["IA", "WA", "AINA"]
+    assert s.due(0.6) == ["WA", "AINA"]
+    assert s.due(0.05) == []
+    assert s.due(1.0, active=("AINA", "WA")) == ["WA", "AINA"]
+
+
+def test_due_same_priority_oldest_first():
+    s = PollScheduler({"IA": (0.0, 0.2, 0, 0.0), "IB": (0.0, 0.2, 0, 0.0)})
+    s.registers["IA"].next_due = 0.3
+    s.registers["IB"].next_due = 0.2
+    assert s.due(1.0) == ["IB", "IA"]
+
+
+def test_next_due_and_poll_now():
+    s = scheduler()
+    for name in ("IA", "WA", "AINA"):
+        s.update(name, 1, 0.0)
+    assert s.next_due() == 0.0
+    assert s.next_due(active=("WA", "AINA")) == 0.05
+    s.update("AINA", 1, 1.0)
+    s.poll_now("AINA")
+    assert s.registers["AINA"].next_due == 0.0
+    assert s.registers["AINA"].interval == 1.0
+    assert s.due(0.0, active=("AINA",)) == ["AINA"]
+
+
+def test_registers_for():
+    assert "AINB" in registers_for(196)
+    assert "W" in registers_for(195)
+    assert registers_for(None) == DEFAULT_REGISTERS
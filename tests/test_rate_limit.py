@@ -0,0 +1,66 @@
+import pytest
+
+from rate_limit import OutputLimiter, within_deadband
+
+
+@pytest.mark.parametrize("old, new, band, expected", [
+    (None, None, 1, True),
+    (None, 0, 1, False),
+    (5, None, 1, False),
+    (10, 11, 1, True),
+    (10, 12, 1, False),
+    (10, 9.5, 1.0, True),
+    (10, 10, None, True),
+    (10, 11, 0, False),
+    ("V", "V", 1, True),
+    ("V", "C", 1, False),
+])
+def test_within_deadband(old, new, band, expected):
+    assert within_deadband(old, new, band) is expected
+
+
+def test_latest_value_wins():
+    gate = OutputLimiter(0.2)
+    gate.offer({"IA": 1})
+    gate.offer({"IA": 2, "MODE": "V"})
+    assert gate.take(0.0) == {"IA": 2, "MODE": "V"}
+    assert gate.offered == 2 and gate.taken == 1
+
+
+def test_min_interval():
+    gate = OutputLimiter(0.2)
+    gate.offer({"IA": 1})
+    gate.take(1.0)
+    gate.offer({"IA": 2})
+    assert gate.wait_time(1.1) == pytest.approx(0.1)
+    assert gate.take(1.1) is None
+    assert gate.take(1.2) == {"IA": 2}
+    assert gate.wait_time(1.3) is None
+
+
+def test_deadband_drops_noise_and_stale_pending():
+    gate = OutputLimiter(0.0, {"IA": 1.0})
+    gate.offer({"IA": 100})
+    gate.take(0.0)
+    gate.offer({"IA": 100.5})
+    assert not gate.ready(0.0)
+    gate.offer({"IA": 103})
+    # Back near what was sent: the pending 103 is dropped again
+    gate.offer({"IA": 100.2})
+    assert gate.take(0.0) is None
+
+
+def test_zero_interval_sends_every_change():
+    gate = OutputLimiter(0.0)
+    for i in range(3):
+        gate.offer({"WA": i})
+        assert gate.take(5.0) == {"WA": i}
+
+
+def test_force_resends_everything():
+    gate = OutputLimiter(0.0)
+    gate.offer({"IA": 1, "MODE": "V"})
+    gate.take(0.0)
+    gate.offer({"IA": 2})
+    gate.force()
+    assert gate.take(0.0) == {"IA": 2, "MODE": "V"}
@@ -0,0 +1,31 @@
+import pytest
+
+from state_snapshot import FIELDS, StateSnapshot
+
+
+def test_get_only_finds_fields():
+    snap = StateSnapshot.empty().next(1.0, FUNC=196, IA=812)
+    assert snap.get("FUNC") == 196
+    assert snap.get("MODE") is None
+    assert snap.get("seq") == 1
+    for name in ("count", "index", "_fields", "next", "READY"):
+        assert snap.get(name) is None
+        assert snap.get(name, "x") == "x"
+
+
+def test_getitem_by_name_and_index():
+    snap = StateSnapshot.empty().next(2.5, WA=1.25)
+    assert snap["WA"] == 1.25
+    assert snap[1] == 2.5
+    with pytest.raises(KeyError):
+        snap["count"]
+
+
+def test_next_and_items():
+    first = StateSnapshot.empty()
+    snap = first.next(3.0, FUNC=195, MODE="V")
+    assert snap.seq == first.seq + 1 and snap.t == 3.0
+    values = dict(snap.items())
+    assert list(values) == list(FIELDS)
+    assert values["FUNC"] == 195 and values["MODE"] == "V"
+    assert values["IB"] is None